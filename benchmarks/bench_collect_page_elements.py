@@ -0,0 +1,87 @@
+"""Benchmark collecting the caption elements and images of large pages.
+
+Compares a separate XPath query per caption tag and one for the images (the
+approach before the elements were collected up front), a single XPath that
+unites all of them and the tree walk used by the plugin. All variants find
+the same elements in the same order.
+
+Usage:
+    python benchmarks/bench_collect_page_elements.py
+"""
+
+from __future__ import annotations
+
+import timeit
+
+from lxml import etree
+
+from mkdocs_caption.engine import CAPTION_TAGS
+from mkdocs_caption.helper import collect_page_elements
+
+REPEAT = 3
+PARSER = etree.HTMLParser()
+
+
+def _page(blocks: int) -> str:
+    return "".join(
+        f'<p><table-caption identifier="Table"></p><p>Caption {index}</p>'
+        "<p><table-caption-end></p><table><tr><td>1</td></tr></table>\n"
+        f'<p>Text with an <img src="img-{index}.png"></p>\n'
+        f'<p><a href="#"><img src="link-{index}.png"></a></p>\n'
+        f'<div><img src="div-{index}.png"></div>\n'
+        f'<p><custom-caption identifier="List"></p><p>List {index}</p>'
+        "<p><custom-caption-end></p><ul><li>Item</li></ul>\n"
+        for index in range(blocks)
+    )
+
+
+def _separate(tree: etree._Element) -> tuple[dict, list]:
+    captions = {tag: tree.xpath(f"//{tag}") for tag in CAPTION_TAGS}
+    return captions, tree.xpath("//p/a/img|//p/img")
+
+
+UNION = etree.XPath(
+    "|".join([*(f"//{tag}" for tag in CAPTION_TAGS), "//p/a/img", "//p/img"]),
+)
+
+
+def _union(tree: etree._Element) -> tuple[dict, list]:
+    captions: dict[str, list] = {tag: [] for tag in CAPTION_TAGS}
+    images = []
+    for element in UNION(tree):
+        if element.tag == "img":
+            images.append(element)
+        else:
+            captions[element.tag].append(element)
+    return captions, images
+
+
+def _walk(tree: etree._Element) -> tuple[dict, list]:
+    elements = collect_page_elements(tree, caption_tags=CAPTION_TAGS)
+    return elements.captions, elements.images
+
+
+def main() -> None:
+    """Run the benchmark and print the results."""
+    print(f"{'blocks':>7} {'variant':>9} {'time [ms]':>10}")
+    for blocks in (50, 1_000, 5_000):
+        tree = etree.fromstring(_page(blocks), PARSER)
+        expected = _separate(tree)
+        for name, function in (
+            ("separate", _separate),
+            ("union", _union),
+            ("walk", _walk),
+        ):
+            assert function(tree) == expected
+            duration = min(
+                timeit.repeat(
+                    lambda: function(tree),  # noqa: B023
+                    number=1,
+                    repeat=REPEAT,
+                ),
+            )
+            print(f"{blocks:>7} {name:>9} {duration * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
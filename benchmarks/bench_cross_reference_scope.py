@@ -0,0 +1,134 @@
+"""Benchmark the `cross_references` scopes on a large corpus.
+
+Generates a site whose pages contain captioned tables and figures, references
+within the page and references to captions on other pages. All events of the
+plugin that handle the captions and references are run for every page in the
+order of a MkDocs build. The Markdown is rendered once up front since it does
+not depend on the scope. Reports the time spent in the plugin per scope, the
+time saved compared to `global` and the number of registered targets once all
+pages were rendered. The `predict` variant is the `global` scope with
+`predict_references`, which predicts every page since each one is referenced
+before it is rendered.
+
+Usage:
+    python benchmarks/bench_cross_reference_scope.py [pages]
+"""
+
+from __future__ import annotations
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import markdown
+from mkdocs.structure.files import File, Files
+from mkdocs.structure.pages import Page
+
+from mkdocs_caption.plugin import CaptionPlugin
+
+EXTENSIONS = ["tables", "attr_list"]
+REPEAT = 3
+
+BLOCK = """\
+## Section {index}
+
+See [the table](#_table-{index}), [the figure](#_figure-{index}),
+[the table on the next page](page-{next}.html#_table-{index}) and
+[](page-{next}.html#_table-{index}).
+
+Table: The caption of table {index}
+
+| Column | Value |
+|--------|-------|
+| a      | {index} |
+
+![Figure {index}](figure-{index}.png "The caption of figure {index}")
+"""
+
+
+def _write_corpus(docs_dir: Path, pages: int, blocks: int) -> list[File]:
+    files = []
+    for number in range(pages):
+        text = f"# Page {number}\n\n" + "".join(
+            BLOCK.format(index=index + 1, next=(number + 1) % pages)
+            for index in range(blocks)
+        )
+        (docs_dir / f"page-{number}.md").write_text(text, encoding="utf-8")
+        files.append(
+            File(
+                f"page-{number}.md",
+                str(docs_dir),
+                str(docs_dir / "site"),
+                use_directory_urls=False,
+            ),
+        )
+    return files
+
+
+def _load_plugin(scope: str, *, predict: bool = False) -> CaptionPlugin:
+    plugin = CaptionPlugin()
+    plugin.load_config({"cross_references": scope, "predict_references": predict})
+    mkdocs_config = MagicMock()
+    mkdocs_config.plugins = {"caption": plugin}
+    plugin.on_config(mkdocs_config)
+    return plugin
+
+
+def _build(
+    variant: str,
+    files: list[File],
+    rendered: list[tuple[str, str]],
+) -> tuple[float, int]:
+    """Run the events of a build and return the time and the targets."""
+    if variant == "predict":
+        plugin = _load_plugin("global", predict=True)
+    else:
+        plugin = _load_plugin(variant)
+    pages = [Page(f"Page {index}", file, {}) for index, file in enumerate(files)]
+    start = time.perf_counter()
+    plugin.on_files(Files(files), config=MagicMock())
+    for page, (source, html) in zip(pages, rendered):
+        plugin.on_page_markdown(source, page=page)
+        page.content = plugin.on_page_content(html, page=page)
+    for page in pages:
+        plugin.on_page_context({}, page=page)
+    elapsed = time.perf_counter() - start
+    targets = plugin.registry_stats["targets"]
+    plugin.on_post_build()
+    return elapsed, targets
+
+
+def main() -> None:
+    """Run the benchmark and print the results."""
+    page_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000
+    with tempfile.TemporaryDirectory() as tmpdir:
+        files = _write_corpus(Path(tmpdir), page_count, blocks=20)
+        plugin = _load_plugin("global")
+        rendered = []
+        for file in files:
+            page = Page(None, file, {})
+            source = plugin.on_page_markdown(file.content_string, page=page)
+            rendered.append(
+                (
+                    file.content_string,
+                    markdown.markdown(source, extensions=EXTENSIONS),
+                ),
+            )
+        print(f"{page_count} pages")
+        print(f"{'scope':>8} {'time [ms]':>10} {'saved [%]':>10} {'targets':>8}")
+        baseline = None
+        for variant in ("global", "predict", "local", "off"):
+            elapsed, targets = min(
+                _build(variant, files, rendered) for _ in range(REPEAT)
+            )
+            baseline = baseline or elapsed
+            saved = (1 - elapsed / baseline) * 100
+            print(
+                f"{variant:>8} {elapsed * 1000:>10.0f} {saved:>10.1f} {targets:>8}",
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+"""Benchmark resolving cross references to other pages.
+
+Compares the previous post processor, which compiles a regex per target and
+applies it to the whole page for every reference found, with the single pass
+resolution. The targets are spread over pages with 100 captions each and the
+referencing page contains a theme-like navigation with many non-empty links.
+References within a page are measured for pages with many captions. Pages
+without references are measured with and without the references collected
+from the rendered content, which lets the post processor skip them. Finally,
+resolving the references in the whole themed output is compared with
+resolving them in the content of the page only, and resolving them after all
+pages were rendered with filling them from predicted targets while the page
+is captioned.
+
+Usage:
+    python benchmarks/bench_cross_references.py
+"""
+
+from __future__ import annotations
+
+import re
+import time
+import timeit
+from functools import partial
+
+from lxml import etree
+from mkdocs.structure.files import File
+from mkdocs.structure.pages import Page
+
+from mkdocs_caption import engine
+from mkdocs_caption.config import CaptionConfig
+from mkdocs_caption.logger import get_logger
+from mkdocs_caption.post_processor import PostProcessor
+
+REPEAT = 3
+TARGETS_PER_PAGE = 100
+
+
+class PreviousPostProcessor:
+    """The post processor before the single pass resolution."""
+
+    def __init__(self, cross_reference_text: str = "{local_ref}") -> None:
+        self._regex_to_apply: dict[str, tuple[re.Pattern, str]] = {}
+        self._local_regex: dict[str, list[tuple[re.Pattern, str]]] = {}
+        self._global_regex: re.Pattern | None = None
+        self._cross_reference_text = cross_reference_text
+
+    def register_target(self, identifier: str, text: str, page: Page) -> None:
+        """Compile the global and the local regex of a target."""
+        self._global_regex = None
+        target_text = self._cross_reference_text.replace(
+            "{page_title}",
+            page.title,
+        ).replace("{local_ref}", text)
+        self._regex_to_apply[rf'{page.file.src_path[:-3]}.html#{identifier}"'] = (
+            re.compile(
+                rf'({re.escape(page.file.src_path[:-3])}.html#{identifier}"[^>]*?>)(<\/a>)',
+                flags=re.MULTILINE | re.DOTALL,
+            ),
+            rf"\1{target_text}\2",
+        )
+        if page.file.src_uri not in self._local_regex:
+            self._local_regex[page.file.src_uri] = []
+        self._local_regex[page.file.src_uri].append(
+            (
+                re.compile(
+                    rf'("#{identifier}"[^>]*?>)(<\/a>)',
+                    flags=re.MULTILINE | re.DOTALL,
+                ),
+                rf"\1{text}\2",
+            ),
+        )
+
+    def post_process(self, page: Page, content: str) -> str:
+        """Apply the local regexes and the global regex of each found target."""
+        for local_regex, target in self._local_regex.get(page.file.src_uri, []):
+            content = local_regex.sub(target, content)
+        if self._global_regex is None:
+            self._global_regex = re.compile(
+                r"|".join(re.escape(regex) for regex in self._regex_to_apply),
+            )
+        result = content
+        for found in self._global_regex.finditer(content):
+            potential_match = found.group()
+            if potential_match not in self._regex_to_apply:
+                continue
+            regex, replacement = self._regex_to_apply[potential_match]
+            result = regex.sub(replacement, result)
+        return result
+
+
+def _page(path: str) -> Page:
+    return Page(
+        title=path,
+        file=File(path=path, src_dir="", dest_dir="", use_directory_urls=False),
+        config={},
+    )
+
+
+def _content(pages: int, references: int) -> str:
+    navigation = "".join(
+        f'<li><a href="../page-{index}.html">Page {index}</a></li>\n'
+        for index in range(pages)
+    )
+    text = "".join(
+        f'<p>See <a href="../page-{index % pages}.html#_table-{index}"></a>.</p>\n'
+        for index in range(references)
+    )
+    return f"<nav><ul>{navigation}</ul></nav>\n<article>{text}</article>"
+
+
+def _register(
+    post_processor: PostProcessor | PreviousPostProcessor,
+    pages: list[Page],
+    targets: int,
+) -> None:
+    for index in range(targets):
+        post_processor.register_target(
+            f"_table-{index}",
+            f"Table {index}",
+            pages[index // TARGETS_PER_PAGE],
+        )
+
+
+def _local_content(targets: int) -> str:
+    return "".join(
+        f'<table id="_table-{index}"></table>\n'
+        f'<p>See <a href="#_table-{index}"></a>.</p>\n'
+        for index in range(targets)
+    )
+
+
+def _bench_local() -> None:
+    page = _page("local.md")
+    print(f"{'local':>8} {'variant':>8} {'register [ms]':>14} {'page [ms]':>10}")
+    for targets in (100, 1_000, 2_000):
+        content = _local_content(targets)
+        pages = [page] * (targets // TARGETS_PER_PAGE)
+        results = []
+        for name, cls in (
+            ("previous", PreviousPostProcessor),
+            ("current", PostProcessor),
+        ):
+            post_processor = cls()
+            register = timeit.timeit(
+                partial(_register, post_processor, pages, targets),
+                number=1,
+            )
+            results.append(post_processor.post_process(page, content))
+            page_time = min(
+                timeit.repeat(
+                    lambda: post_processor.post_process(page, content),  # noqa: B023
+                    number=1,
+                    repeat=REPEAT,
+                ),
+            )
+            print(
+                f"{targets:>8} {name:>8} {register * 1000:>14.1f} "
+                f"{page_time * 1000:>10.2f}",
+            )
+        assert results[0] == results[1]
+
+
+def _bench_unreferenced(targets: int = 10_000) -> None:
+    pages = [_page(f"page-{i}.md") for i in range(targets // TARGETS_PER_PAGE)]
+    page = _page("sub/unreferenced.md")
+    article = "<p>Text without references.</p>\n" * 200
+    content = _content(1_000, 0).replace("<article></article>", article)
+    print(f"{'no refs':>8} {'variant':>10} {'page [ms]':>10}")
+
+    def collected(post_processor: PostProcessor) -> str:
+        post_processor.collect_references(page, article)
+        return post_processor.post_process(page, content)
+
+    for name, cls, function in (
+        ("previous", PreviousPostProcessor, PreviousPostProcessor.post_process),
+        ("scanned", PostProcessor, PostProcessor.post_process),
+        ("collected", PostProcessor, None),
+    ):
+        post_processor = cls()
+        _register(post_processor, pages, targets)
+        if function is None:
+            call = partial(collected, post_processor)
+        else:
+            call = partial(function, post_processor, page, content)
+        call()
+        page_time = min(timeit.repeat(call, number=1, repeat=REPEAT))
+        print(f"{targets:>8} {name:>10} {page_time * 1000:>10.3f}")
+
+
+def _bench_content_region(targets: int = 10_000, references: int = 100) -> None:
+    pages = [_page(f"page-{i}.md") for i in range(targets // TARGETS_PER_PAGE)]
+    page = _page("sub/referencing.md")
+    output = _content(1_000, references)
+    article = output[output.index("<article>") :]
+    post_processor = PostProcessor()
+    _register(post_processor, pages, targets)
+    print(f"{'refs':>8} {'region':>10} {'size [kB]':>10} {'page [ms]':>10}")
+    for name, content in (("output", output), ("content", article)):
+
+        def call(content: str = content) -> str:
+            post_processor.collect_references(page, article)
+            return post_processor.post_process(page, content)
+
+        page_time = min(timeit.repeat(call, number=1, repeat=REPEAT))
+        print(
+            f"{references:>8} {name:>10} {len(content) / 1000:>10.0f} "
+            f"{page_time * 1000:>10.3f}",
+        )
+
+
+def _predict(post_processor: PostProcessor, pages: list[Page]) -> None:
+    for index, page in enumerate(pages):
+        first = index * TARGETS_PER_PAGE
+        post_processor.predict_targets(
+            page.file,
+            page.title,
+            {
+                f"_table-{number}": f"Table {number}"
+                for number in range(first, first + TARGETS_PER_PAGE)
+            },
+        )
+
+
+def _bench_predicted(targets: int = 10_000, references: int = 1_000) -> None:
+    pages = [_page(f"page-{i}.md") for i in range(targets // TARGETS_PER_PAGE)]
+    page = _page("sub/referencing.md")
+    html = '<p><img alt="Caption" src="a.png"></p>\n' + "".join(
+        f'<p>See <a href="../page-{index // TARGETS_PER_PAGE}.html#_table-{index}">'
+        "</a>.</p>\n"
+        for index in range(references)
+    )
+    config = CaptionConfig()
+    config.validate()
+    print(f"{'refs':>8} {'variant':>10} {'content [ms]':>13} {'context [ms]':>13}")
+    for name in ("rendered", "predicted"):
+        content_times, context_times = [], []
+        for _ in range(REPEAT):
+            post_processor = PostProcessor()
+            if name == "predicted":
+                _predict(post_processor, pages)
+            start = time.perf_counter()
+            content = engine.postprocess_dom(
+                html,
+                parser=etree.HTMLParser(),
+                config=config,
+                page=page,
+                post_processor=post_processor,
+                logger=get_logger("bench"),
+            )
+            post_processor.collect_references(page, content)
+            content_times.append(time.perf_counter() - start)
+            # The targets are registered once the other pages were rendered.
+            _register(post_processor, pages, targets)
+            start = time.perf_counter()
+            content = post_processor.post_process(page, content)
+            context_times.append(time.perf_counter() - start)
+        assert content.count("</a>") == content.count("</a>.") == references
+        assert f">Table {references - 1}</a>" in content
+        print(
+            f"{references:>8} {name:>10} {min(content_times) * 1000:>13.2f} "
+            f"{min(context_times) * 1000:>13.3f}",
+        )
+
+
+def main() -> None:
+    """Run the benchmark and print the results."""
+    _bench_predicted()
+    _bench_content_region()
+    _bench_unreferenced()
+    _bench_local()
+    referencing_page = _page("sub/referencing.md")
+    print(
+        f"{'targets':>8} {'refs':>6} {'variant':>8} "
+        f"{'register [ms]':>14} {'page [ms]':>10}",
+    )
+    for targets in (1_000, 10_000, 30_000):
+        pages = [_page(f"page-{i}.md") for i in range(targets // TARGETS_PER_PAGE)]
+        for references in (10, 100, 1_000):
+            content = _content(len(pages), min(references, targets))
+            results = []
+            for name, cls in (
+                ("previous", PreviousPostProcessor),
+                ("current", PostProcessor),
+            ):
+                post_processor = cls()
+                register = timeit.timeit(
+                    lambda: _register(post_processor, pages, targets),  # noqa: B023
+                    number=1,
+                )
+                # The first page compiles the previous global regex
+                results.append(post_processor.post_process(referencing_page, content))
+                page = min(
+                    timeit.repeat(
+                        lambda: post_processor.post_process(  # noqa: B023
+                            referencing_page,
+                            content,  # noqa: B023
+                        ),
+                        number=1,
+                        repeat=REPEAT,
+                    ),
+                )
+                print(
+                    f"{targets:>8} {references:>6} {name:>8} "
+                    f"{register * 1000:>14.1f} {page * 1000:>10.2f}",
+                )
+            assert results[0] == results[1]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Benchmark the dom and the stream engine on a very large page.
+
+Every engine runs in a separate process so the reported peak resident memory
+(including the memory of the lxml trees) is not influenced by the others.
+
+Usage:
+    python benchmarks/bench_engines.py [tables]
+"""
+
+from __future__ import annotations
+
+import resource
+import subprocess
+import sys
+import time
+
+from lxml import etree
+from mkdocs.structure.files import File
+from mkdocs.structure.pages import Page
+
+from mkdocs_caption import engine
+from mkdocs_caption.config import CaptionConfig
+from mkdocs_caption.logger import get_logger
+from mkdocs_caption.post_processor import PostProcessor
+
+TABLES = 4_000
+
+
+def _page_html(tables: int) -> str:
+    # The markup as rendered by Python-Markdown from the wrapped captions
+    rows = "<tr>\n<td>1</td>\n<td>2</td>\n<td>3</td>\n</tr>\n" * 20
+    return "\n".join(
+        f'<p><table-caption identifier="Table"></p>\n'
+        f"<p>Caption of table {index}</p>\n"
+        f"<p><table-caption-end></p>\n"
+        f"<table>\n<thead>\n<tr>\n<th>a</th>\n<th>b</th>\n<th>c</th>\n</tr>\n"
+        f"</thead>\n<tbody>\n{rows}</tbody>\n</table>\n"
+        f'<p>Some text with a <img alt="figure {index}" src="img-{index}.png" /></p>'
+        for index in range(tables)
+    )
+
+
+def _run(name: str, tables: int) -> None:
+    config = CaptionConfig()
+    config.load_dict({})
+    config.validate()
+    html = _page_html(tables)
+    page = Page(
+        title="Benchmark",
+        file=File(path="bench.md", src_dir="", dest_dir="", use_directory_urls=False),
+        config={},
+    )
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    kwargs = {
+        "config": config,
+        "page": page,
+        "post_processor": PostProcessor(),
+        "logger": get_logger(page.file.src_path),
+    }
+    if name == "dom":
+        result = engine.postprocess_dom(html, parser=etree.HTMLParser(), **kwargs)
+    else:
+        result = engine.postprocess_stream(html, **kwargs)
+    duration = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(
+        f"{name:>7} {len(html) / 1e6:>10.1f} {len(result) / 1e6:>11.1f} "
+        f"{duration:>9.2f} {(peak - baseline) / 1024:>14.0f}",
+    )
+
+
+def main() -> None:
+    """Run the benchmark and print the results."""
+    tables = int(sys.argv[1]) if len(sys.argv) > 1 else TABLES
+    print(
+        f"{'engine':>7} {'input [MB]':>10} {'output [MB]':>11} {'time [s]':>9} "
+        f"{'peak RSS [MB]':>14}",
+    )
+    for name in ("dom", "stream"):
+        subprocess.run(  # noqa: S603
+            [sys.executable, __file__, "--run", name, str(tables)],
+            check=True,
+        )
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--run"]:
+        _run(sys.argv[2], int(sys.argv[3]))
+    else:
+        main()
@@ -0,0 +1,104 @@
+"""Benchmark preprocessing the markdown of all pages with worker processes.
+
+Writes a site whose pages contain captioned tables, figures and custom
+captions. Compares wrapping the caption identifiers of each page in
+`on_page_markdown` (the default) with reading and wrapping the markdown of
+all pages in `on_files` (`preprocess_workers`) with a varying number of worker
+processes. The time includes reading the files, the prefetched variants also
+include looking up the result in `on_page_markdown`.
+
+Usage:
+    python benchmarks/bench_markdown_prefetch.py [pages]
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from unittest.mock import MagicMock
+
+from mkdocs.structure.files import File, Files
+from mkdocs.structure.pages import Page
+from mkdocs.utils import meta
+
+from mkdocs_caption.plugin import CaptionPlugin
+
+BLOCK = """\
+## Section {index}
+
+See [the table](#_table-{index}) and [the figure](#_figure-{index}).
+
+Table: The caption of table {index}
+
+| Column | Value |
+|--------|-------|
+| a      | {index} |
+
+![Figure {index}](figure-{index}.png "The caption of figure {index}")
+
+List: The caption of list {index}
+
+- Item
+"""
+
+
+def _write_corpus(docs_dir: Path, pages: int, blocks: int) -> list[File]:
+    files = []
+    for number in range(pages):
+        text = f"# Page {number}\n\n" + "".join(
+            BLOCK.format(index=index + 1) for index in range(blocks)
+        )
+        (docs_dir / f"page-{number}.md").write_text(text, encoding="utf-8")
+        files.append(
+            File(
+                f"page-{number}.md",
+                str(docs_dir),
+                str(docs_dir / "site"),
+                use_directory_urls=False,
+            ),
+        )
+    return files
+
+
+def _build(files: list[File], workers: int) -> tuple[float, int]:
+    """Run the events of a build and return the time and prefetched pages."""
+    plugin = CaptionPlugin()
+    plugin.load_config(
+        {
+            "additional_identifier": ["List"],
+            "cross_references": "off",
+            "preprocess_workers": workers,
+        },
+    )
+    mkdocs_config = MagicMock()
+    mkdocs_config.plugins = {"caption": plugin}
+    plugin.on_config(mkdocs_config)
+    start = time.perf_counter()
+    plugin.on_files(Files(files), config=MagicMock())
+    for file in files:
+        markdown, page_meta = meta.get_data(file.content_string)
+        page = Page(None, file, {})
+        page.meta = page_meta
+        plugin.on_page_markdown(markdown, page=page)
+    elapsed = time.perf_counter() - start
+    return elapsed, plugin.stats.get("prefetched_pages", 0)
+
+
+def main() -> None:
+    """Run the benchmark and print the results."""
+    page_count = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000
+    print(f"{page_count} pages, {os.cpu_count()} CPUs")
+    print(f"{'variant':>10} {'time [ms]':>10} {'prefetched':>11}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        files = _write_corpus(Path(tmpdir), page_count, blocks=20)
+        for workers in (0, 1, 2, 4):
+            elapsed, prefetched = _build(files, workers)
+            name = f"workers/{workers}" if workers else "inline"
+            print(f"{name:>10} {elapsed * 1000:>10.0f} {prefetched:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Benchmark the cache of captioned pages across builds.
+
+Generates the rendered HTML of a site whose pages contain captioned tables and
+figures and runs the events of the plugin that caption the pages and resolve
+the references for every page. Compares a build without the cache with a
+first build that fills the cache and a second build that reuses it, on disk
+and in memory across the rebuilds of `mkdocs serve`.
+
+Usage:
+    python benchmarks/bench_page_cache.py [pages]
+"""
+
+from __future__ import annotations
+
+import sys
+import tempfile
+import time
+from unittest.mock import MagicMock
+
+import markdown
+from mkdocs.structure.files import File
+from mkdocs.structure.pages import Page
+
+from mkdocs_caption.plugin import CaptionPlugin
+
+EXTENSIONS = ["tables", "attr_list"]
+
+BLOCK = """\
+## Section {index}
+
+See [the table](#_table-{index}) and [the figure](#_figure-{index}).
+
+Table: The caption of table {index}
+
+| Column | Value |
+|--------|-------|
+| a      | {index} |
+
+![Figure {index}](figure-{index}.png "The caption of figure {index}")
+"""
+
+
+def _load_plugin(cache_dir: str | None, command: str = "build") -> CaptionPlugin:
+    options = {}
+    if cache_dir is not None:
+        options["cache"] = {"enable": True, "directory": cache_dir}
+    plugin = CaptionPlugin()
+    plugin.load_config(options)
+    plugin.on_startup(command=command, dirty=False)
+    _configure(plugin)
+    return plugin
+
+
+def _configure(plugin: CaptionPlugin) -> None:
+    mkdocs_config = MagicMock()
+    mkdocs_config.plugins = {"caption": plugin}
+    mkdocs_config.config_file_path = None
+    plugin.on_config(mkdocs_config)
+
+
+def _build(plugin: CaptionPlugin, rendered: list[str]) -> tuple[float, dict]:
+    """Run the events of a build and return the time and the statistics."""
+    pages = [
+        Page(
+            f"Page {index}",
+            File(f"page-{index}.md", "", "", use_directory_urls=False),
+            {},
+        )
+        for index in range(len(rendered))
+    ]
+    start = time.perf_counter()
+    for page, html in zip(pages, rendered):
+        page.content = plugin.on_page_content(html, page=page)
+    for page in pages:
+        plugin.on_page_context({}, page=page)
+    plugin.on_post_build()
+    return time.perf_counter() - start, plugin.stats
+
+
+def main() -> None:
+    """Run the benchmark and print the results."""
+    page_count = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000
+    plugin = _load_plugin(None)
+    page = Page(None, File("page.md", "", "", use_directory_urls=False), {})
+    rendered = []
+    for number in range(page_count):
+        source = f"# Page {number}\n\n" + "".join(
+            BLOCK.format(index=index + 1) for index in range(20)
+        )
+        source = plugin.on_page_markdown(source, page=page)
+        rendered.append(markdown.markdown(source, extensions=EXTENSIONS))
+    print(f"{page_count} pages")
+    print(f"{'variant':>10} {'time [ms]':>10} {'cached pages':>13}")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        serve = _load_plugin(None, command="serve")
+        for name, plugin in (
+            ("no cache", _load_plugin(None)),
+            ("cold", _load_plugin(cache_dir)),
+            ("warm", _load_plugin(cache_dir)),
+            ("serve", serve),
+            ("rebuild", serve),
+        ):
+            if name == "rebuild":
+                _configure(plugin)
+            elapsed, stats = _build(plugin, rendered)
+            print(
+                f"{name:>10} {elapsed * 1000:>10.0f} "
+                f"{stats.get('cached_pages', 0):>13}",
+            )
+
+
+if __name__ == "__main__":
+    main()
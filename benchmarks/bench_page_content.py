@@ -0,0 +1,88 @@
+"""Benchmark parsing and serializing the HTML content of large pages.
+
+Compares the previous approach (a new parser for every page and slicing the
+serialized `<html><body>` document) with the shared parser and the fragment
+serialization used by the plugin. Reports the run time and the peak of the
+memory traced by `tracemalloc` for multi-megabyte pages.
+
+Usage:
+    python benchmarks/bench_page_content.py
+"""
+
+from __future__ import annotations
+
+import timeit
+import tracemalloc
+from typing import Callable
+
+from lxml import etree
+
+from mkdocs_caption.helper import serialize_html_fragment
+
+REPEAT = 5
+PARSER = etree.HTMLParser()
+
+
+def _page(blocks: int) -> str:
+    return "".join(
+        f"<p>Paragraph {index} with <em>text</em> &amp; an "
+        f'<img src="img-{index}.png"></p>\n'
+        f"<table><tr><td>{index}</td></tr></table>\n"
+        for index in range(blocks)
+    )
+
+
+def _previous(html: str) -> str:
+    tree = etree.fromstring(html, etree.HTMLParser())
+    html_result = etree.tostring(tree, encoding="unicode", method="html")
+    return html_result[len("<html><body>") : -len("</body></html>")]
+
+
+def _current(html: str) -> str:
+    tree = etree.fromstring(html, PARSER)
+    return serialize_html_fragment(tree)
+
+
+def _peak(function: Callable[[str], str], html: str) -> int:
+    tracemalloc.start()
+    function(html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main() -> None:
+    """Run the benchmark and print the results."""
+    print(
+        f"{'size [MB]':>9} {'variant':>8} {'time [ms]':>10} {'peak [MB]':>10}",
+    )
+    for blocks in (10_000, 50_000, 100_000):
+        html = _page(blocks)
+        assert _previous(html) == _current(html)
+        for name, function in (("previous", _previous), ("current", _current)):
+            duration = min(
+                timeit.repeat(
+                    lambda: function(html),  # noqa: B023
+                    number=1,
+                    repeat=REPEAT,
+                ),
+            )
+            print(
+                f"{len(html) / 1e6:>9.1f} {name:>8} {duration * 1000:>10.1f} "
+                f"{_peak(function, html) / 1e6:>10.1f}",
+            )
+    small = _page(20)
+    for name, function in (("previous", _previous), ("current", _current)):
+        duration = min(
+            timeit.repeat(
+                lambda: function(small),  # noqa: B023
+                number=1_000,
+                repeat=REPEAT,
+            ),
+        )
+        # 1000 runs in seconds equals the time per run in milliseconds
+        print(f"{'small':>9} {name:>8} {duration:>10.3f} {'':>10}")
+
+
+if __name__ == "__main__":
+    main()
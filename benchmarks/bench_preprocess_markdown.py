@@ -0,0 +1,82 @@
+"""Benchmark the markdown preprocessing for a growing number of identifiers.
+
+The caption markers of all identifiers are wrapped in a single pass. This
+benchmark compares it to one pass per identifier and shows that the cost
+stays flat when the number of identifiers grows.
+
+Usage:
+    python benchmarks/bench_preprocess_markdown.py
+"""
+
+from __future__ import annotations
+
+import timeit
+
+from mkdocs_caption.helper import MarkdownCaptionTarget, wrap_md_captions
+
+PARAGRAPHS = 2_000
+REPEAT = 5
+
+
+def _targets(count: int) -> dict[str, MarkdownCaptionTarget]:
+    targets = {
+        "Table:": MarkdownCaptionTarget("table-caption", allow_indented_caption=True),
+        "Figure:": MarkdownCaptionTarget("figure-caption", allow_indented_caption=True),
+    }
+    for index in range(count):
+        targets[f"Custom{index}:"] = MarkdownCaptionTarget(
+            "custom-caption",
+            allow_indented_caption=True,
+        )
+    return targets
+
+
+def _markdown(targets: dict[str, MarkdownCaptionTarget]) -> str:
+    identifiers = list(targets)
+    blocks = []
+    for index in range(PARAGRAPHS):
+        blocks.append(f"Some text of paragraph {index} with *emphasis*.")
+        if index % 10 == 0:
+            identifier = identifiers[index // 10 % len(identifiers)]
+            blocks.append(f"{identifier} Caption {index} {{#id-{index}}}")
+    return "\n\n".join(blocks) + "\n"
+
+
+def _per_identifier(markdown: str, targets: dict[str, MarkdownCaptionTarget]) -> str:
+    for identifier, target in targets.items():
+        markdown = wrap_md_captions(markdown, targets={identifier: target})
+    return markdown
+
+
+def main() -> None:
+    """Run the benchmark and print the results."""
+    print(f"{'identifiers':>11} {'per identifier [ms]':>20} {'single pass [ms]':>17}")
+    for count in (1, 5, 15, 30):
+        targets = _targets(count)
+        markdown = _markdown(targets)
+        assert _per_identifier(markdown, targets) == wrap_md_captions(
+            markdown,
+            targets=targets,
+        )
+        per_identifier = min(
+            timeit.repeat(
+                lambda: _per_identifier(markdown, targets),  # noqa: B023
+                number=1,
+                repeat=REPEAT,
+            ),
+        )
+        single_pass = min(
+            timeit.repeat(
+                lambda: wrap_md_captions(markdown, targets=targets),  # noqa: B023
+                number=1,
+                repeat=REPEAT,
+            ),
+        )
+        print(
+            f"{len(targets):>11} {per_identifier * 1000:>20.2f} "
+            f"{single_pass * 1000:>17.2f}",
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Benchmark the memory of the cross reference target registry.
+
+Registers synthetic targets (100 per page, numbered per page like the default
+identifiers) with the previous post processor,
+which compiled two regexes per target, and with the current one. Reports the
+number of compiled patterns kept by the post processor, the memory traced by
+`tracemalloc` that the registry holds afterwards and the peak resident memory
+of the registration. Every variant runs in a separate process, once with and
+once without tracing. The registration time is reported by
+`bench_cross_references.py`.
+
+Usage:
+    python benchmarks/bench_target_registry.py [targets]
+"""
+
+from __future__ import annotations
+
+import re
+import resource
+import subprocess
+import sys
+import tracemalloc
+from typing import TYPE_CHECKING
+
+from bench_cross_references import TARGETS_PER_PAGE, PreviousPostProcessor, _page
+
+from mkdocs_caption.post_processor import PostProcessor
+
+if TYPE_CHECKING:
+    from mkdocs.structure.pages import Page
+
+TARGETS = 100_000
+VARIANTS = {"previous": PreviousPostProcessor, "current": PostProcessor}
+
+
+def _count_patterns(value: object) -> int:
+    if isinstance(value, re.Pattern):
+        return 1
+    if isinstance(value, dict):
+        return sum(_count_patterns(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_count_patterns(item) for item in value)
+    if hasattr(value, "__slots__"):
+        return sum(_count_patterns(getattr(value, name)) for name in value.__slots__)
+    if hasattr(value, "__dict__"):
+        return _count_patterns(vars(value))
+    return 0
+
+
+def _register(
+    post_processor: PostProcessor | PreviousPostProcessor,
+    pages: list[Page],
+    targets: int,
+) -> None:
+    for index in range(targets):
+        number = index % TARGETS_PER_PAGE + 1
+        post_processor.register_target(
+            f"_table-{number}",
+            f"Table {number}: Caption of table {index}",
+            pages[index // TARGETS_PER_PAGE],
+        )
+
+
+def _run(name: str, targets: int, *, traced: bool) -> None:
+    pages = [_page(f"page-{i}.md") for i in range(targets // TARGETS_PER_PAGE)]
+    if traced:
+        tracemalloc.start()
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    post_processor = VARIANTS[name]()
+    _register(post_processor, pages, targets)
+    # Compiled patterns are also cached by the re module
+    re.purge()
+    if traced:
+        registry, _ = tracemalloc.get_traced_memory()
+        print(
+            f"{name:>8} {_count_patterns(post_processor):>9} "
+            f"{registry / 1024 / 1024:>14.1f}",
+            end=" ",
+            flush=True,
+        )
+    else:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print(f"{(peak - baseline) / 1024:>14.1f}")
+
+
+def main() -> None:
+    """Run the benchmark and print the results."""
+    targets = int(sys.argv[1]) if len(sys.argv) > 1 else TARGETS
+    print(f"{targets} targets")
+    print(
+        f"{'variant':>8} {'patterns':>9} {'registry [MB]':>14} "
+        f"{'peak RSS [MB]':>14}",
+    )
+    for name in VARIANTS:
+        for mode in ("traced", "untraced"):
+            subprocess.run(  # noqa: S603
+                [sys.executable, __file__, "--run", name, str(targets), mode],
+                check=True,
+            )
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--run"]:
+        _run(sys.argv[2], int(sys.argv[3]), traced=sys.argv[4] == "traced")
+    else:
+        main()
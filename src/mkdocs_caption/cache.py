@@ -0,0 +1,245 @@
+"""Persistent cache of the captioned HTML content of pages.
+
+The captioned content of a page only depends on its rendered HTML, its
+configuration and the plugin version. It is stored on disk together with the
+cross reference targets of the page, keyed by a hash of these inputs, so
+unchanged pages are neither parsed nor captioned again in later builds. The
+cache is bounded in size and the least recently used entries are evicted.
+
+While `mkdocs serve` rebuilds the site, the entries are additionally kept in
+memory. Entries that were not used by a build are dropped after it, so the
+memory only holds the entries of the current site.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import json
+import os
+from collections import Counter
+from importlib.metadata import PackageNotFoundError, version
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from mkdocs_caption.config import CaptionConfig
+
+    # The captioned content and the identifier and text of each target
+    Entry = tuple[str, list[tuple[str, str]]]
+
+try:
+    _VERSION = version("mkdocs-caption")
+except PackageNotFoundError:  # pragma: no cover
+    _VERSION = "unknown"
+
+
+# The options that do not change the captioned content of a page. The cached
+# content is captioned without filling its references.
+_IGNORED_OPTIONS = frozenset(("cache", "predict_references"))
+
+
+class PageCache:
+    """Content-addressed cache of captioned pages on disk and in memory.
+
+    Args:
+        directory: The directory the entries are stored in or None to only
+            keep them in memory.
+        max_size: The maximum size of all entries on disk in bytes.
+        memory: The entries kept in memory or None to only store them on disk.
+            The dictionary is owned by the caller so it can outlive the cache.
+    """
+
+    def __init__(
+        self,
+        directory: Path | None,
+        max_size: int,
+        *,
+        memory: dict[str, Entry] | None = None,
+    ) -> None:
+        self._directory = directory
+        self._max_size = max_size
+        self._memory = memory
+        self._used: set[str] = set()
+        self._fingerprints: dict[int, tuple[CaptionConfig, str]] = {}
+        self._stats: Counter[str] = Counter()
+
+    def _fingerprint(self, config: CaptionConfig) -> str:
+        """Get the part of the key that identifies a page configuration.
+
+        The configurations of pages are shared, so the fingerprint is only
+        computed once per configuration. The configuration is kept alive with
+        its fingerprint so its id is not reused.
+
+        Args:
+            config: The configuration for the page.
+
+        Returns:
+            The fingerprint of the configuration.
+        """
+        cached = self._fingerprints.get(id(config))
+        if cached is None:
+            options = {
+                key: value
+                for key, value in config.items()
+                if key not in _IGNORED_OPTIONS
+            }
+            fingerprint = json.dumps(options, sort_keys=True, default=dict)
+            cached = self._fingerprints[id(config)] = (config, fingerprint)
+        return cached[1]
+
+    def key(self, html: str, config: CaptionConfig, *, kind: str = "html") -> str:
+        """Get the key of a page.
+
+        Args:
+            html: HTML rendered from Markdown source as string
+            config: The configuration for the page.
+            kind: The kind of source, so different sources of a page with the
+                same text do not share their entries.
+
+        Returns:
+            The key of the page.
+        """
+        digest = hashlib.sha256(f"{_VERSION}:{kind}:".encode())
+        digest.update(self._fingerprint(config).encode())
+        digest.update(html.encode("utf-8", "surrogatepass"))
+        return digest.hexdigest()
+
+    def get(self, key: str, *, persistent: bool = True) -> Entry | None:
+        """Get the captioned content and the targets of a page.
+
+        Args:
+            key: The key of the page.
+            persistent: Whether to look for the entry on disk as well.
+
+        Returns:
+            The captioned content and the identifier and text of each target
+            or None if the page is not cached.
+        """
+        if self._memory is not None and key in self._memory:
+            self._used.add(key)
+            self._stats["hits"] += 1
+            self._stats["memory_hits"] += 1
+            return self._memory[key]
+        entry = self._read(key) if persistent else None
+        if entry is None:
+            self._stats["misses"] += 1
+            return None
+        self._stats["hits"] += 1
+        if self._memory is not None:
+            self._used.add(key)
+            self._memory[key] = entry
+        return entry
+
+    def _read(self, key: str) -> Entry | None:
+        """Read an entry from disk.
+
+        Args:
+            key: The key of the page.
+
+        Returns:
+            The entry or None if it does not exist or is invalid.
+        """
+        if self._directory is None:
+            return None
+        path = self._directory / f"{key}.json"
+        try:
+            entry = json.loads(path.read_bytes())
+            html = entry["html"]
+            targets = [(identifier, text) for identifier, text in entry["targets"]]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        # The modification time marks the last use for the eviction.
+        with contextlib.suppress(OSError):
+            os.utime(path)
+        return html, targets
+
+    def put(
+        self,
+        key: str,
+        html: str,
+        targets: dict[str, str],
+        *,
+        persistent: bool = True,
+    ) -> None:
+        """Store the captioned content and the targets of a page.
+
+        Args:
+            key: The key of the page.
+            html: The captioned content of the page.
+            targets: The text of each target of the page by its identifier.
+            persistent: Whether to store the entry on disk as well.
+        """
+        if self._memory is not None:
+            self._used.add(key)
+            self._memory[key] = (html, list(targets.items()))
+        if persistent and self._directory is not None:
+            self._write(key, html, targets)
+
+    def _write(self, key: str, html: str, targets: dict[str, str]) -> None:
+        """Write an entry to disk.
+
+        Args:
+            key: The key of the page.
+            html: The captioned content of the page.
+            targets: The text of each target of the page by its identifier.
+        """
+        if self._directory is None:  # pragma: no cover
+            return
+        data = json.dumps({"html": html, "targets": list(targets.items())})
+        path = self._directory / f"{key}.json"
+        temporary = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        try:
+            self._directory.mkdir(parents=True, exist_ok=True)
+            temporary.write_text(data, encoding="utf-8")
+            temporary.replace(path)
+        except OSError:
+            with contextlib.suppress(OSError):
+                temporary.unlink()
+            return
+        self._stats["writes"] += 1
+
+    def prune(self) -> None:
+        """Evict the entries that are no longer needed.
+
+        The entries in memory that were not used since the last call are
+        dropped. On disk the least recently used entries are evicted until
+        the cache fits its size.
+        """
+        if self._memory is not None:
+            for key in self._memory.keys() - self._used:
+                del self._memory[key]
+            self._used.clear()
+        if self._directory is None:
+            return
+        entries = []
+        with contextlib.suppress(OSError):
+            for path in self._directory.glob("*.json"):
+                with contextlib.suppress(OSError):
+                    stat = path.stat()
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, path in sorted(entries, key=lambda entry: entry[0]):
+            if size <= self._max_size:
+                break
+            with contextlib.suppress(OSError):
+                path.unlink()
+                size -= entry_size
+                self._stats["evictions"] += 1
+        self._stats["size"] = size
+
+    def reset_stats(self) -> dict[str, int]:
+        """Get the statistics of the current build and start a new one.
+
+        Returns:
+            The number of hits, hits in memory, misses, writes and evictions
+            and the size of the cache on disk in bytes.
+        """
+        stats = {
+            key: self._stats[key]
+            for key in ("hits", "memory_hits", "misses", "writes", "evictions", "size")
+        }
+        self._stats.clear()
+        self._fingerprints.clear()
+        return stats
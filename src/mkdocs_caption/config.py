@@ -2,10 +2,72 @@
 
 from __future__ import annotations
 
+import string
 import typing as t
+from functools import lru_cache, partial
 
 from mkdocs.config import base, config_options
 
+# The placeholders that are replaced with the identifier
+_IDENTIFIER_FIELDS: dict[str, t.Callable[[str], str]] = {
+    "Identifier": str.capitalize,
+    "identifier": str.lower,
+}
+
+
+def _escape(text: str) -> str:
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+@lru_cache(maxsize=256)
+def _compile_template(template: str, identifier: str) -> t.Callable[..., str]:
+    """Specialize a template for an identifier.
+
+    The identifier placeholders are replaced once, so only the index is left
+    to be formatted. Placeholders with a format spec or conversion are kept.
+
+    Args:
+        template: The template to compile.
+        identifier: The identifier to use.
+
+    Returns:
+        A function that formats the template for an index.
+    """
+    parts = []
+    for literal, field, spec, conversion in string.Formatter().parse(template):
+        parts.append(_escape(literal))
+        if field is None:
+            continue
+        if field in _IDENTIFIER_FIELDS and not spec and not conversion:
+            parts.append(_escape(_IDENTIFIER_FIELDS[field](identifier)))
+            continue
+        parts.append(
+            f"{{{field}{'!' + conversion if conversion else ''}"
+            f"{':' + spec if spec else ''}}}",
+        )
+    return partial(
+        "".join(parts).format,
+        Identifier=identifier.capitalize(),
+        identifier=identifier.lower(),
+    )
+
+
+@lru_cache(maxsize=4096)
+def _format_template(template: str, identifier: str, index: int | None) -> str:
+    """Format a template for an identifier and an index.
+
+    The indices repeat on every page, so the results are cached.
+
+    Args:
+        template: The template to format.
+        identifier: The identifier to use.
+        index: The index to use.
+
+    Returns:
+        The formatted string.
+    """
+    return _compile_template(template, identifier)(index=index)
+
 
 class IdentifierCaption(base.Config):
     """The generic configuration options for a specific identifier.
@@ -46,11 +108,7 @@ class IdentifierCaption(base.Config):
         Returns:
             The formatted string.
         """
-        return input_str.format(
-            Identifier=identifier.capitalize(),
-            identifier=identifier.lower(),
-            index=index,
-        )
+        return _format_template(input_str, identifier, index)
 
     def get_markdown_identifier(self, identifier: str) -> str:
         """Get the markdown identifier for the given identifier.
@@ -119,6 +177,20 @@ class FigureCaption(IdentifierCaption):
     ignore_hash = config_options.Type(bool, default=False)
 
 
+class CacheConfig(base.Config):
+    """The configuration options for the cache of captioned pages.
+
+    Args:
+        enable: Whether to cache the captioned pages across builds.
+        directory: The directory of the cache relative to the config file.
+        max_size: The maximum size of the cache in MiB.
+    """
+
+    enable = config_options.Type(bool, default=False)
+    directory = config_options.Type(str, default=".cache/mkdocs-caption")
+    max_size = config_options.Type(int, default=256)
+
+
 class CaptionConfig(base.Config):
     """The configuration options for the Caption plugin.
 
@@ -126,9 +198,24 @@ class CaptionConfig(base.Config):
         additional_identifier: The additional identifiers to use.
             (e.g. ["List"])
         cross_reference_text: The text to use for cross-references.
+        cross_references: The references that are resolved. `global`
+            resolves references to captions on all pages, `local` only
+            references within a page and `off` none at all.
+        predict_references: Whether to predict the targets of pages that are
+            rendered later from their markdown, so references to them are
+            filled while the referencing page is captioned. This makes builds
+            slower, especially with the cache.
+        preprocess_workers: The number of processes that preprocess the
+            markdown of all pages once the files were collected. `0`
+            preprocesses the markdown of each page before it is rendered.
+        engine: The engine that applies the captions to the HTML of a page.
+            `dom` parses the whole page into a tree, `stream` parses it
+            incrementally with bounded memory and `auto` selects the stream
+            engine for very large pages.
         table: The configuration options for tables.
         figure: The configuration options for figures.
         custom: The configuration options for custom elements.
+        cache: The configuration options for the cache of captioned pages.
     """
 
     additional_identifier = config_options.ListOfItems(
@@ -136,9 +223,20 @@ class CaptionConfig(base.Config):
         default=[],
     )
     cross_reference_text = config_options.Type(str, default="{page_title}/{local_ref}")
+    cross_references = config_options.Choice(
+        ("off", "local", "global"),
+        default="global",
+    )
+    predict_references = config_options.Type(bool, default=False)
+    preprocess_workers = config_options.Type(int, default=0)
+    engine = config_options.Choice(
+        ("dom", "stream", "auto"),
+        default="auto",
+    )
     table = config_options.SubConfig(IdentifierCaption)
     figure = config_options.SubConfig(FigureCaption)
     custom = config_options.SubConfig(IdentifierCaption)
+    cache = config_options.SubConfig(CacheConfig)
 
 
 def update_config(config: CaptionConfig, updates: dict[str, t.Any]) -> CaptionConfig:
@@ -155,7 +253,9 @@ def update_config(config: CaptionConfig, updates: dict[str, t.Any]) -> CaptionCo
         "additional_identifier",
         config.additional_identifier,
     )
-    config.table.load_dict(updates.get("table", {}))
-    config.figure.load_dict(updates.get("figure", {}))
-    config.custom.load_dict(updates.get("custom", {}))
+    # `load_dict` would also remember every patch in the sub configuration,
+    # which grows with each page of each build.
+    config.table.update(updates.get("table", {}))
+    config.figure.update(updates.get("figure", {}))
+    config.custom.update(updates.get("custom", {}))
     return config
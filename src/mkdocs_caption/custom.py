@@ -8,7 +8,10 @@ from lxml import etree
 
 from mkdocs_caption.helper import (
     CaptionInfo,
+    MarkdownCaptionTarget,
+    PageElements,
     TreeElement,
+    create_caption_element,
     iter_caption_elements,
     wrap_md_captions,
 )
@@ -42,17 +45,35 @@ def preprocess_markdown(
     Returns:
         markdown string with custom captions wrapped
     """
+    return wrap_md_captions(
+        markdown,
+        targets=get_markdown_targets(config=config, identifiers=identifiers),
+    )
+
+
+def get_markdown_targets(
+    *,
+    config: IdentifierCaption,
+    identifiers: list[str],
+) -> dict[str, MarkdownCaptionTarget]:
+    """Get the markdown identifiers that need to be wrapped.
+
+    Args:
+        config: plugin configuration for custom captions
+        identifiers: list of identifiers to wrap
+
+    Returns:
+        The markdown identifiers mapped to their wrapping target.
+    """
     if not config.enable:
-        return markdown
-    for identifier in identifiers:
-        md_identifier = config.get_markdown_identifier(identifier)
-        markdown = wrap_md_captions(
-            markdown,
-            identifier=md_identifier,
-            html_tag=CAPTION_TAG,
-            allow_indented_caption=config.allow_indented_caption,
-        )
-    return markdown
+        return {}
+    target = MarkdownCaptionTarget(
+        html_tag=CAPTION_TAG,
+        allow_indented_caption=config.allow_indented_caption,
+    )
+    return {
+        config.get_markdown_identifier(identifier): target for identifier in identifiers
+    }
 
 
 def _wrap_in_figure(
@@ -84,22 +105,14 @@ def _wrap_in_figure(
     caption_info.target_element.addprevious(figure_element)
 
     # add caption
-    caption_prefix = config.get_caption_prefix(
-        identifier=caption_info.identifier,
-        index=index,
+    fig_caption_element = create_caption_element(
+        "figcaption",
+        prefix=config.get_caption_prefix(
+            identifier=caption_info.identifier,
+            index=index,
+        ),
+        caption=caption_info.caption_elements,
     )
-    try:
-        fig_caption_element = etree.fromstring(
-            f"<figcaption>{caption_prefix} {caption_info.caption}</figcaption>",
-        )
-    except etree.XMLSyntaxError:
-        logger.error(
-            'Invalid XML in caption: <caption style="caption-side:%s">%s %s</caption>',
-            config.position,
-            caption_prefix,
-            caption_info.caption,
-        )
-        return None
     if config.position == "top":
         figure_element.append(fig_caption_element)
         figure_element.append(caption_info.target_element)
@@ -122,6 +135,8 @@ def postprocess_html(
     page: Page,
     post_processor: PostProcessor,
     logger: PluginLogger,
+    elements: PageElements | None = None,
+    indices: dict[str, int] | None = None,
 ) -> None:
     """Handle custom captions in an XML tree.
 
@@ -134,11 +149,19 @@ def postprocess_html(
         page: The current page.
         post_processor: The post processor to register targets.
         logger: Current plugin logger.
+        elements: The caption elements and images of the page if they were
+            already collected.
+        indices: The next index per identifier. Updated in place to continue
+            the numbering if a page is processed in parts.
     """
     if not config.enable:
         return
-    index_dict: dict[str, int] = {}
-    for caption_info in iter_caption_elements(CAPTION_TAG, tree):
+    index_dict = {} if indices is None else indices
+    for caption_info in iter_caption_elements(
+        CAPTION_TAG,
+        tree,
+        elements=elements,
+    ):
         index = index_dict.get(caption_info.identifier, config.start_index)
         index_dict[caption_info.identifier] = index + config.increment_index
         figure_id = _wrap_in_figure(
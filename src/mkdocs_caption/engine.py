@@ -0,0 +1,357 @@
+"""Engines that apply the captions to the HTML content of a page.
+
+The `dom` engine parses the whole page into a single tree. The `stream`
+engine parses the page incrementally and only keeps the top level elements
+in memory that belong to the caption block currently processed.
+"""
+
+from __future__ import annotations
+
+import html
+from typing import TYPE_CHECKING
+
+from lxml import etree
+
+from mkdocs_caption import custom, image, table
+from mkdocs_caption.helper import (
+    TreeElement,
+    collect_page_elements,
+    serialize_html_fragment,
+)
+
+if TYPE_CHECKING:
+    from mkdocs.structure.pages import Page
+
+    from mkdocs_caption.config import CaptionConfig
+    from mkdocs_caption.logger import PluginLogger
+    from mkdocs_caption.post_processor import PostProcessor
+
+CAPTION_TAGS = (table.TABLE_CAPTION_TAG, custom.CAPTION_TAG, image.IMG_CAPTION_TAG)
+
+# Pages with at least this many characters are processed by the stream engine
+# if the engine is set to `auto`.
+STREAM_THRESHOLD = 4 * 1024 * 1024
+
+# The number of characters that are fed to the stream parser at once.
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def select_engine(engine: str, html: str) -> str:
+    """Select the engine that processes a page.
+
+    Args:
+        engine: The configured engine (dom, stream or auto).
+        html: HTML rendered from Markdown source as string
+
+    Returns:
+        The engine to use (dom or stream).
+    """
+    if engine != "auto":
+        return engine
+    return "stream" if len(html) >= STREAM_THRESHOLD else "dom"
+
+
+def postprocess_tree(
+    tree: TreeElement,
+    *,
+    config: CaptionConfig,
+    page: Page,
+    post_processor: PostProcessor,
+    logger: PluginLogger,
+    indices: dict[str, dict[str, int]] | None = None,
+) -> None:
+    """Apply the table, custom and figure captions to an XML tree.
+
+    Args:
+        tree: The root element of the XML tree.
+        config: The configuration for the page.
+        page: The current page.
+        post_processor: The post processor to register targets.
+        logger: Current plugin logger.
+        indices: The next index per identifier for each caption type. Updated
+            in place to continue the numbering if a page is processed in parts.
+    """
+    if indices is None:
+        indices = {"table": {}, "custom": {}, "figure": {}}
+    # Collect all caption elements and images in a single walk of the tree
+    # and dispatch them to the handlers in the original order.
+    elements = collect_page_elements(tree, caption_tags=CAPTION_TAGS)
+    table.postprocess_html(
+        tree=tree,
+        config=config["table"],
+        page=page,
+        post_processor=post_processor,
+        logger=logger,
+        elements=elements,
+        indices=indices["table"],
+    )
+    custom.postprocess_html(
+        tree=tree,
+        config=config["custom"],
+        logger=logger,
+        page=page,
+        post_processor=post_processor,
+        elements=elements,
+        indices=indices["custom"],
+    )
+    image.postprocess_html(
+        tree=tree,
+        config=config["figure"],
+        page=page,
+        post_processor=post_processor,
+        logger=logger,
+        elements=elements,
+        indices=indices["figure"],
+    )
+
+
+def postprocess_dom(
+    html: str,
+    *,
+    parser: etree.HTMLParser,
+    config: CaptionConfig,
+    page: Page,
+    post_processor: PostProcessor,
+    logger: PluginLogger,
+    fill_references: bool = True,
+) -> str:
+    """Apply the captions to a page by parsing it into a single tree.
+
+    The references of the page are filled once all its targets are known.
+
+    Args:
+        html: HTML rendered from Markdown source as string
+        parser: The HTML parser to use.
+        config: The configuration for the page.
+        page: The current page.
+        post_processor: The post processor to register targets.
+        logger: Current plugin logger.
+        fill_references: Whether to fill the references of the page.
+
+    Returns:
+        The processed HTML content of the page.
+    """
+    tree = etree.fromstring(html, parser)
+    if tree is None:  # pragma: no cover
+        return html
+    postprocess_tree(
+        tree,
+        config=config,
+        page=page,
+        post_processor=post_processor,
+        logger=logger,
+    )
+    if fill_references:
+        post_processor.fill_references(page, tree.iter("a"))
+    return serialize_html_fragment(tree)
+
+
+class _CaptionBlock:
+    """Top level elements that have to be processed together.
+
+    A caption marker, its caption text, the end marker and the target element
+    are consecutive top level elements if the caption is not nested. The block
+    is complete once the element following the end marker was added.
+    """
+
+    __slots__ = ("elements", "end_tag", "needs_target")
+
+    def __init__(self) -> None:
+        self.elements: list[TreeElement] = []
+        self.end_tag: str | None = None
+        self.needs_target = False
+
+    @property
+    def complete(self) -> bool:
+        """Whether no further element belongs to the block."""
+        return self.end_tag is None and not self.needs_target
+
+    def add(self, element: TreeElement) -> None:
+        """Add the next top level element to the block.
+
+        Args:
+            element: The top level element.
+        """
+        self.elements.append(element)
+        if self.end_tag is not None:
+            if any(child.tag == self.end_tag for child in element):
+                self.end_tag = None
+                self.needs_target = True
+            return
+        self.needs_target = False
+        for child in element:
+            if child.tag in CAPTION_TAGS:
+                self.end_tag = f"{child.tag}-end"
+                return
+
+
+def _needs_processing(elements: list[TreeElement]) -> bool:
+    """Check if any of the elements contains a caption element or an image.
+
+    Args:
+        elements: The top level elements.
+
+    Returns:
+        True if the elements need to be processed, False otherwise.
+    """
+    return any(
+        next(element.iter(*CAPTION_TAGS, "img"), None) is not None
+        for element in elements
+    )
+
+
+class _StreamProcessor:
+    """Apply the captions to a page while it is parsed incrementally."""
+
+    def __init__(
+        self,
+        *,
+        config: CaptionConfig,
+        page: Page,
+        post_processor: PostProcessor,
+        logger: PluginLogger,
+        fill_references: bool = True,
+    ) -> None:
+        self._config = config
+        self._page = page
+        self._post_processor = post_processor
+        self._logger = logger
+        self._fill_references = fill_references
+        self._parser = etree.HTMLPullParser(events=("start",), tag="body")
+        self._indices: dict[str, dict[str, int]] = {
+            "table": {},
+            "custom": {},
+            "figure": {},
+        }
+        self._block = _CaptionBlock()
+        self._body: TreeElement | None = None
+        self._output: list[str] = []
+
+    def feed(self, data: str) -> None:
+        """Feed the next part of the page to the parser.
+
+        Args:
+            data: The next part of the page.
+        """
+        self._parser.feed(data)
+        self._detach(keep=1)
+
+    def close(self) -> str | None:
+        """Process the remaining elements of the page.
+
+        Returns:
+            The processed HTML content of the page or None if the page has no
+            elements to process (e.g. only comments or whitespace).
+        """
+        root = self._parser.close()
+        if root is None:
+            return None
+        self._detach(keep=0)
+        if self._body is None:
+            # A page with only head elements
+            return serialize_html_fragment(root)
+        if self._block.elements:
+            self._process(self._block.elements)
+        return "".join(self._output)
+
+    def _detach(self, *, keep: int) -> None:
+        """Detach the completed top level elements from the parsed document.
+
+        The last top level element may still be parsed (including its tail)
+        and is kept while the parser is not closed. The leading text of the
+        body is complete once its first element started.
+
+        Args:
+            keep: The number of top level elements to keep.
+        """
+        if self._body is None:
+            for _, body in self._parser.read_events():
+                self._body = body
+                # The document head is complete once the body started.
+                for head in body.itersiblings("head", preceding=True):
+                    self._output.extend(self._serialize(element) for element in head)
+            if self._body is None:
+                return
+        body = self._body
+        if body.text and (len(body) or not keep):
+            self._output.append(html.escape(body.text, quote=False))
+            body.text = None
+        while len(body) > keep:
+            element = body[0]
+            body.remove(element)
+            self._block.add(element)
+            if self._block.complete:
+                self._process(self._block.elements)
+                self._block = _CaptionBlock()
+
+    @staticmethod
+    def _serialize(element: TreeElement) -> str:
+        return etree.tostring(element, encoding="unicode", method="html")
+
+    def _process(self, elements: list[TreeElement]) -> None:
+        """Process consecutive top level elements and append them to the output.
+
+        Args:
+            elements: The top level elements.
+        """
+        if _needs_processing(elements):
+            root = etree.Element("html", None, None)
+            body = etree.SubElement(root, "body", None, None)
+            body.extend(elements)
+            postprocess_tree(
+                root,
+                config=self._config,
+                page=self._page,
+                post_processor=self._post_processor,
+                logger=self._logger,
+                indices=self._indices,
+            )
+            elements = list(body)
+        if self._fill_references:
+            for element in elements:
+                self._post_processor.fill_references(self._page, element.iter("a"))
+        self._output.extend(self._serialize(element) for element in elements)
+
+
+def postprocess_stream(
+    html: str,
+    *,
+    config: CaptionConfig,
+    page: Page,
+    post_processor: PostProcessor,
+    logger: PluginLogger,
+    fill_references: bool = True,
+) -> str:
+    """Apply the captions to a page while parsing it incrementally.
+
+    The page is fed to a pull parser in chunks and completed top level
+    elements are detached from the parsed document right away. Elements that
+    belong to the same caption block are processed together in a separate
+    tree, all others are serialized as they are. The memory usage is thereby
+    bounded by the largest caption block instead of the page size.
+
+    Args:
+        html: HTML rendered from Markdown source as string
+        config: The configuration for the page.
+        page: The current page.
+        post_processor: The post processor to register targets.
+        logger: Current plugin logger.
+        fill_references: Whether to fill the references of the page.
+
+    Returns:
+        The processed HTML content of the page.
+    """
+    processor = _StreamProcessor(
+        config=config,
+        page=page,
+        post_processor=post_processor,
+        logger=logger,
+        fill_references=fill_references,
+    )
+    if not html:
+        return html
+    for start in range(0, len(html), STREAM_CHUNK_SIZE):
+        processor.feed(html[start : start + STREAM_CHUNK_SIZE])
+    result = processor.close()
+    # Like the dom engine, pages without elements are returned as they are.
+    return html if result is None else result
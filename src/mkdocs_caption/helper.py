@@ -5,6 +5,7 @@ from __future__ import annotations
 import re
 import typing as t
 from dataclasses import dataclass
+from functools import lru_cache
 
 from lxml import etree
 
@@ -14,6 +15,14 @@ if t.TYPE_CHECKING:
 TreeElement = etree._Element  # noqa: SLF001
 
 
+@dataclass(frozen=True)
+class MarkdownCaptionTarget:
+    """Dataclass to store how a markdown caption identifier is wrapped."""
+
+    html_tag: str
+    allow_indented_caption: bool
+
+
 def _parse_extended_markdown(options: str | None) -> str:
     """Parse special extended markdown syntax.
 
@@ -44,94 +53,377 @@ def _parse_extended_markdown(options: str | None) -> str:
     return " ".join(output_options)
 
 
-def _escape_md_caption(match: re.Match, *, target_tag: str) -> str:
-    """Escape custom captions in a markdown string.
+def _split_caption_options(block: str) -> tuple[str, str | None]:
+    """Split the options from the text of a caption block.
+
+    The options are enclosed in curly brackets at the end of the block, e.g.
+    `Caption text {#id .class}`.
 
-    This function takes a regular expression match object and returns a string
+    Args:
+        block: The caption text following the identifier.
+
+    Returns:
+        The caption text and the raw options (None if there are none).
+    """
+    if block.endswith("}"):
+        options_start = block.find("{")
+        if options_start != -1:
+            return block[:options_start], block[options_start + 1 : -1]
+    return block, None
+
+
+def _escape_md_caption(
+    block: str,
+    *,
+    prefix: str,
+    md_identifier: str,
+    target_tag: str,
+) -> list[str]:
+    """Escape a custom caption in a markdown string.
+
+    This function takes the text of a caption block and returns the lines
     with the custom caption escaped using a custom HTML tag.
 
     Args:
-        match: A regular expression match object.
+        block: The caption text following the identifier.
+        prefix: The indentation of the caption.
+        md_identifier: The markdown identifier of the caption.
         target_tag: The target HTML tag to use.
 
     Returns:
-        A string with the custom caption escaped using a custom HTML tag.
-    """
-    prefix = match.group(1)
-    identifier = match.group(2).rstrip(":")
-    caption = match.group(3).replace("\n", " ")
-    options = _parse_extended_markdown(match.group(5))
-    return str(
-        f'\n{prefix}<{target_tag} identifier="{identifier}"'
-        f"{options}>\n\n{prefix}{caption}\n\n{prefix}<{target_tag}-end>\n\n",
-    )
+        The lines with the custom caption escaped using a custom HTML tag.
+    """
+    identifier = md_identifier.rstrip(":")
+    caption, raw_options = _split_caption_options(block)
+    caption = caption.replace("\n", " ")
+    options = _parse_extended_markdown(raw_options)
+    return [
+        "",
+        f'{prefix}<{target_tag} identifier="{identifier}"{options}>',
+        "",
+        f"{prefix}{caption}",
+        "",
+        f"{prefix}<{target_tag}-end>",
+        "",
+    ]
+
+
+@lru_cache(maxsize=256)
+def parse_caption_marker(marker: str) -> tuple[str, tuple[tuple[str, str], ...]]:
+    """Parse a caption marker created by `wrap_md_captions`.
+
+    Args:
+        marker: The html of the marker (e.g. `<table-caption identifier="Table">`).
+
+    Raises:
+        ValueError: If the marker contains no element.
+
+    Returns:
+        The tag and the attributes of the marker.
+    """
+    root = etree.fromstring(marker, etree.HTMLParser())
+    element = None if root is None else root.find("body/*")
+    if element is None:
+        msg = f"Invalid caption marker: {marker}"
+        raise ValueError(msg)
+    return str(element.tag), tuple(element.items())
+
+
+_INDENTATION = re.compile(r"[^\S\r\n]*")
+
+
+@lru_cache(maxsize=32)
+def _index_identifiers(
+    targets: tuple[tuple[str, bool], ...],
+) -> dict[str, list[tuple[str, bool]]]:
+    """Index the markdown identifiers by their first word.
+
+    This allows to look up the identifiers a line can start with in constant
+    time, independent of how many identifiers there are. Longer identifiers
+    are placed first so that an identifier that is a prefix of another one
+    does not shadow it.
+
+    Args:
+        targets: Tuples of the markdown identifier and a flag if an indented
+            caption is allowed for it.
+
+    Returns:
+        The identifiers and their indentation flag, indexed by their first word.
+    """
+    index: dict[str, list[tuple[str, bool]]] = {}
+    for identifier, allow_indented in sorted(
+        targets,
+        key=lambda target: len(target[0]),
+        reverse=True,
+    ):
+        first_word = identifier.split(" ", 1)[0]
+        index.setdefault(first_word, []).append((identifier, allow_indented))
+    return index
+
+
+def _match_caption_marker(
+    line: str,
+    index: dict[str, list[tuple[str, bool]]],
+) -> tuple[str, str, str] | None:
+    """Match a line that starts a caption.
+
+    Args:
+        line: The line to match.
+        index: The identifiers indexed by their first word.
+
+    Returns:
+        The indentation, the markdown identifier and the remaining text of the
+        line or None if the line does not start a caption.
+    """
+    indent_end = _INDENTATION.match(line).end()  # type: ignore[union-attr]
+    first_word_end = line.find(" ", indent_end)
+    if first_word_end == -1:
+        return None
+    for identifier, allow_indented in index.get(
+        line[indent_end:first_word_end],
+        (),
+    ):
+        if indent_end and not allow_indented:
+            continue
+        if line.startswith(f"{identifier} ", indent_end):
+            return (
+                line[:indent_end],
+                identifier,
+                line[indent_end + len(identifier) + 1 :],
+            )
+    return None
 
 
 def wrap_md_captions(
     markdown: str,
     *,
-    identifier: str,
-    html_tag: str,
-    allow_indented_caption: bool,
+    targets: dict[str, MarkdownCaptionTarget],
 ) -> str:
     """Preprocess markdown to wrap custom captions.
 
     The custom captions are wrapped in a custom html
-    tag to make them easier to find later.
+    tag to make them easier to find later. All identifiers are handled in a
+    single pass over the markdown, independent of how many there are.
+
+    A caption starts with its identifier at the beginning of a line (optionally
+    indented) and ends with the first blank line. The markdown is processed
+    line by line without backtracking, so the time is linear in the size of
+    the markdown for any input.
 
     Args:
         markdown: markdown string
-        identifier: identifier to wrap
-        html_tag: html tag to wrap the caption in
-        allow_indented_caption: Flag if indented captions are allowed
+        targets: markdown identifiers mapped to the target they are wrapped in
 
     Returns:
         markdown string with custom captions wrapped
     """
-    prefix = r"([^\S\r\n]*?)" if allow_indented_caption else "^()"
-    return re.sub(
-        rf"{prefix}({identifier}) (.*?)({{(.*?)}})?\n\n",
-        lambda match: _escape_md_caption(match, target_tag=html_tag),
-        markdown,
-        flags=re.MULTILINE | re.DOTALL,
+    if not targets:
+        return markdown
+    index = _index_identifiers(
+        tuple(
+            (identifier, target.allow_indented_caption)
+            for identifier, target in targets.items()
+        ),
     )
+    lines = markdown.split("\n")
+    # The last line is not followed by a newline and can not end a caption.
+    last_line = len(lines) - 1
+    result: list[str] = []
+    line_index = 0
+    blank_index = 0
+    while line_index < len(lines):
+        line = lines[line_index]
+        marker = _match_caption_marker(line, index)
+        if marker is None:
+            result.append(line)
+            line_index += 1
+            continue
+        # The position of the next blank line only ever moves forward, which
+        # keeps the search linear even for many unterminated captions.
+        blank_index = max(blank_index, line_index + 1)
+        while blank_index < last_line and lines[blank_index]:
+            blank_index += 1
+        if blank_index >= last_line:
+            # Without a blank line none of the remaining captions is complete
+            break
+        prefix, md_identifier, first_line = marker
+        result.extend(
+            _escape_md_caption(
+                "\n".join([first_line, *lines[line_index + 1 : blank_index]]),
+                prefix=prefix,
+                md_identifier=md_identifier,
+                target_tag=targets[md_identifier].html_tag,
+            ),
+        )
+        line_index = blank_index + 1
+    result.extend(lines[line_index:])
+    return "\n".join(result)
+
+
+def create_caption_element(
+    tag: str,
+    *,
+    prefix: str,
+    caption: str | list[TreeElement],
+    attrib: dict[str, str] | None = None,
+) -> TreeElement:
+    """Create a caption element from a prefix and the caption.
 
-
-def create_caption_str(caption_text_elements: list[TreeElement]) -> str:
-    """Create a htaml string from a list of caption text elements.
-
-    This function takes a list of caption text elements and returns a string
-    with the caption text.
+    The caption is either plain text or a list of caption text elements. The
+    caption text elements are moved into the new element, so no serialization
+    or parsing is required. A single paragraph is unwrapped, i.e. only its
+    content is moved.
 
     Args:
-        caption_text_elements: The list of caption text elements.
+        tag: The tag of the caption element.
+        prefix: The prefix of the caption (e.g. `Figure 1:`).
+        caption: The caption text or the list of caption text elements.
+        attrib: Attributes of the caption element.
 
     Returns:
-        A string with the caption text.
+        The caption element.
     """
-    caption_text = ""
-    for text_element in caption_text_elements:
-        caption_text += etree.tostring(
-            text_element,
-            encoding="unicode",
-            method="html",
-        ).strip("\n")
-    if len(caption_text_elements) == 1:
-        caption_text = caption_text.strip("<p>").strip("</p>")
-    return caption_text
+    caption_element = etree.Element(tag, attrib, None)
+    if isinstance(caption, str):
+        caption_element.text = f"{prefix} {caption}"
+    elif len(caption) == 1 and caption[0].tag == "p":
+        caption_element.text = f"{prefix} {caption[0].text or ''}"
+        caption_element.extend(list(caption[0]))
+    else:
+        caption_element.text = f"{prefix} "
+        for text_element in caption:
+            text_element.tail = None
+            caption_element.append(text_element)
+    return caption_element
 
 
 @dataclass
 class CaptionInfo:
-    """Dataclass to store information about a caption."""
+    """Dataclass to store information about a caption.
+
+    The caption text elements are no longer part of the tree and can be moved
+    into the caption element.
+    """
+
+    __slots__ = ("attributes", "caption_elements", "identifier", "target_element")
 
     target_element: TreeElement
     attributes: dict[str, str]
-    caption: str
+    caption_elements: list[TreeElement]
     identifier: str
 
+    @property
+    def caption(self) -> str:
+        """The plain text of the caption."""
+        return " ".join(
+            "".join(text_element.itertext()).strip()
+            for text_element in self.caption_elements
+        )
+
+
+@lru_cache(maxsize=8)
+def _compile_tag_xpath(tag: str) -> etree.XPath:
+    """Compile an XPath that finds all elements with the given tag.
+
+    Args:
+        tag: The tag of the elements.
 
-def iter_caption_elements(tag: str, tree: TreeElement) -> Iterator[CaptionInfo]:
+    Returns:
+        The compiled XPath.
+    """
+    return etree.XPath(f"//{tag}")
+
+
+def _is_caption_end(element: TreeElement, end_tag: str) -> bool:
+    """Check if an element wraps the end marker of a caption.
+
+    Args:
+        element: The element to check.
+        end_tag: The tag of the end marker.
+
+    Returns:
+        True if a direct child of the element is the end marker.
+    """
+    return any(child.tag == end_tag for child in element)
+
+
+@dataclass
+class PageElements:
+    """Dataclass to store the caption elements and images of a page.
+
+    All elements are stored in document order.
+    """
+
+    captions: dict[str, list[TreeElement]]
+    images: list[TreeElement]
+
+
+def _is_paragraph_image(image: TreeElement) -> bool:
+    """Check if an image is in a paragraph, directly or within a link.
+
+    Args:
+        image: The image element.
+
+    Returns:
+        True if the image can be captioned, False otherwise.
+    """
+    parent = image.getparent()
+    if parent is not None and parent.tag == "a":
+        parent = parent.getparent()
+    return parent is not None and parent.tag == "p"
+
+
+def collect_page_elements(
+    tree: TreeElement,
+    *,
+    caption_tags: tuple[str, ...],
+) -> PageElements:
+    """Collect all caption elements and images of a page in a single pass.
+
+    Args:
+        tree: The root element of the XML tree.
+        caption_tags: The tags of the caption elements.
+
+    Returns:
+        The caption elements grouped by tag and the images that can be
+        captioned.
+    """
+    elements = PageElements(captions={tag: [] for tag in caption_tags}, images=[])
+    for element in tree.iter(*caption_tags, "img"):
+        if element.tag != "img":
+            elements.captions[str(element.tag)].append(element)
+        elif _is_paragraph_image(element):
+            elements.images.append(element)
+    return elements
+
+
+def is_attached(element: TreeElement, tree: TreeElement) -> bool:
+    """Check if an element is still part of a tree.
+
+    Elements collected upfront may have been removed from the tree in the
+    meantime (e.g. because they were part of a caption text).
+
+    Args:
+        element: The element to check.
+        tree: The root element of the XML tree.
+
+    Returns:
+        True if the element is part of the tree, False otherwise.
+    """
+    # Removed elements keep a reference to their original document, so the
+    # ancestors have to be checked instead of the root of the element tree.
+    root = element
+    for root in element.iterancestors():  # noqa: B007
+        pass
+    return root is tree
+
+
+def iter_caption_elements(
+    tag: str,
+    tree: TreeElement,
+    *,
+    elements: PageElements | None = None,
+) -> Iterator[CaptionInfo]:
     """Iterate over all caption elements in an XML tree.
 
     This function takes an XML tree and iterates over all caption elements
@@ -142,33 +434,66 @@ def iter_caption_elements(tag: str, tree: TreeElement) -> Iterator[CaptionInfo]:
     Args:
         tag: The tag of the caption elements.
         tree: The XML tree to iterate over.
+        elements: The elements of the page if they were already collected.
 
     Yields:
         A tuple with the target element, the attributes of the caption
         element, the caption text, and the identifier of the caption element.
     """
-    for caption_element in tree.xpath(f"//{tag}"):
+    if elements is None:
+        caption_elements = _compile_tag_xpath(tag)(tree)
+    else:
+        caption_elements = [
+            element for element in elements.captions[tag] if is_attached(element, tree)
+        ]
+    end_tag = f"{tag}-end"
+    for caption_element in caption_elements:
         a_wrapper = caption_element.getparent()
         caption_text_elements = []
         a_wrapper_end = a_wrapper.getnext()
-        while a_wrapper_end is not None and not a_wrapper_end.xpath(f"{tag}-end"):
+        while a_wrapper_end is not None and not _is_caption_end(a_wrapper_end, end_tag):
             caption_text_elements.append(a_wrapper_end)
             a_wrapper_end = a_wrapper_end.getnext()
 
         target_element = a_wrapper_end.getnext()
         # unused attribute identifier
         identifier = caption_element.attrib.pop("identifier")
+        caption_info = CaptionInfo(
+            target_element=target_element,
+            attributes=caption_element.attrib,
+            caption_elements=caption_text_elements,
+            identifier=identifier,
+        )
+        # The wrappers and the caption text are consecutive siblings and are
+        # removed together (the caption element is removed with its wrapper).
+        parent = a_wrapper.getparent()
+        for element in (a_wrapper, *caption_text_elements, a_wrapper_end):
+            parent.remove(element)
+        yield caption_info
+
+
+def serialize_html_fragment(tree: TreeElement) -> str:
+    """Serialize an XML tree that was parsed from an HTML fragment.
+
+    The HTMLParser wraps a fragment in `<html><body>` and moves leading
+    elements that belong into the document head (e.g. `<style>`) into a
+    `<head>` element. Only the content of these sections is serialized.
 
-        try:
-            yield CaptionInfo(
-                target_element=target_element,
-                attributes=caption_element.attrib,
-                caption=create_caption_str(caption_text_elements),
-                identifier=identifier,
-            )
-        finally:
-            a_wrapper.remove(caption_element)
-            a_wrapper.getparent().remove(a_wrapper)
-            for caption_text_element in caption_text_elements:
-                caption_text_element.getparent().remove(caption_text_element)
-            a_wrapper_end.getparent().remove(a_wrapper_end)
+    Args:
+        tree: The root element of the XML tree.
+
+    Returns:
+        The HTML fragment as string.
+    """
+    parts = []
+    for section in tree:
+        html = etree.tostring(
+            section,
+            encoding="unicode",
+            method="html",
+            with_tail=False,
+        )
+        # Strip the start and end tag of the section in a single slice.
+        parts.append(html[html.find(">") + 1 : html.rfind("<")])
+    # Joining a single part returns it without another copy.
+    return "".join(parts)
@@ -8,7 +8,13 @@ from typing import TYPE_CHECKING
 from lxml import etree
 
 from mkdocs_caption.helper import (
+    CaptionInfo,
+    MarkdownCaptionTarget,
+    PageElements,
     TreeElement,
+    collect_page_elements,
+    create_caption_element,
+    is_attached,
     iter_caption_elements,
     wrap_md_captions,
 )
@@ -38,15 +44,26 @@ def preprocess_markdown(markdown: str, *, config: FigureCaption) -> str:
     Returns:
         markdown string with custom captions wrapped
     """
+    return wrap_md_captions(markdown, targets=get_markdown_targets(config=config))
+
+
+def get_markdown_targets(*, config: FigureCaption) -> dict[str, MarkdownCaptionTarget]:
+    """Get the markdown identifiers that need to be wrapped.
+
+    Args:
+        config: plugin configuration for images
+
+    Returns:
+        The markdown identifiers mapped to their wrapping target.
+    """
     if not config.enable:
-        return markdown
-    identifier = config.get_markdown_identifier("figure")
-    return wrap_md_captions(
-        markdown,
-        identifier=identifier,
-        html_tag=IMG_CAPTION_TAG,
-        allow_indented_caption=config.allow_indented_caption,
-    )
+        return {}
+    return {
+        config.get_markdown_identifier("figure"): MarkdownCaptionTarget(
+            html_tag=IMG_CAPTION_TAG,
+            allow_indented_caption=config.allow_indented_caption,
+        ),
+    }
 
 
 def wrap_image(
@@ -93,9 +110,8 @@ def wrap_image(
 def postprocess_image(
     *,
     img_element: TreeElement,
-    title: str,
+    title: str | list[TreeElement],
     config: FigureCaption,
-    logger: PluginLogger,
     index: int,
     figure_attrib: dict[str, str] | None,
     page: Page,
@@ -110,9 +126,9 @@ def postprocess_image(
 
     Args:
         img_element: The image element to postprocess.
-        title: The title of the image.
+        title: The caption of the image. Either the title text or the caption
+            text elements of a figure caption.
         config: The plugin configuration.
-        logger: Current plugin logger.
         index: The index of the image element.
         figure_attrib: Additional attributes for the figure element.
         page: The current page.
@@ -123,33 +139,20 @@ def postprocess_image(
     # Its a bit of a tricky situation here. The user can specify a custom id
     # both on the figure element and the image element. The references to both
     # of these elements needs to be updated.
+    reference_text = config.get_reference_text(index=index, identifier="figure")
     if "id" in img_element.attrib:
-        post_processor.register_target(
-            img_element.attrib["id"],
-            config.get_reference_text(index=index, identifier="figure"),
-            page,
-        )
+        post_processor.register_target(img_element.attrib["id"], reference_text, page)
     if not figure_attrib:
         figure_attrib = {}
     if "id" not in figure_attrib:
         figure_attrib["id"] = config.get_default_id(index=index, identifier="figure")
-    post_processor.register_target(
-        figure_attrib["id"],
-        config.get_reference_text(index=index, identifier="figure"),
-        page,
-    )
+    post_processor.register_target(figure_attrib["id"], reference_text, page)
     # assemble the caption element
-    caption_prefix = config.get_caption_prefix(
-        index=index,
-        identifier="figure",
+    caption_element = create_caption_element(
+        "figcaption",
+        prefix=config.get_caption_prefix(index=index, identifier="figure"),
+        caption=title,
     )
-    try:
-        caption_element = etree.fromstring(
-            f"<figcaption>{caption_prefix} {title}</figcaption>",
-        )
-    except etree.XMLSyntaxError:
-        logger.error("Invalid XML in caption: %s", title)
-        return
     # wrap the image in figure with the caption element
     wrap_image(
         img=img_element,
@@ -172,6 +175,26 @@ def _has_url_fragment(img_element: TreeElement) -> bool:
     return urllib.parse.urlparse(img_element.get("src")).fragment is not None
 
 
+def _is_figure_candidate(img_element: TreeElement, tree: TreeElement) -> bool:
+    """Check if a collected image element can still be captioned.
+
+    Images are collected before the other captions are processed. These may
+    have moved or removed images since, so the image is checked to still be
+    part of the tree and directly within a paragraph (optionally in a link).
+
+    Args:
+        img_element: The image element to check.
+        tree: The root element of the XML tree.
+
+    Returns:
+        True if the image can be captioned, False otherwise.
+    """
+    parent = img_element.getparent()
+    if parent is not None and parent.tag == "a":
+        parent = parent.getparent()
+    return parent is not None and parent.tag == "p" and is_attached(img_element, tree)
+
+
 def _get_siblings(
     img_element: TreeElement,
     config: FigureCaption,
@@ -217,6 +240,8 @@ def postprocess_html(
     page: Page,
     post_processor: PostProcessor,
     logger: PluginLogger,
+    elements: PageElements | None = None,
+    indices: dict[str, int] | None = None,
 ) -> None:
     """Postprocess an XML tree to handle custom image captions.
 
@@ -231,13 +256,22 @@ def postprocess_html(
         page: The current page.
         post_processor: The post processor to register targets.
         logger: Current plugin logger.
+        elements: The caption elements and images of the page if they were
+            already collected.
+        indices: The next index per identifier. Updated in place to continue
+            the numbering if a page is processed in parts.
     """
     if not config.enable:
         return
+    indices = {} if indices is None else indices
 
     # Handle additional figure caption elements
-    custom_figure_attrib = {}
-    for caption_info in iter_caption_elements(IMG_CAPTION_TAG, tree):
+    figure_captions: dict[TreeElement, CaptionInfo] = {}
+    for caption_info in iter_caption_elements(
+        IMG_CAPTION_TAG,
+        tree,
+        elements=elements,
+    ):
         try:
             target_element = (
                 caption_info.target_element
@@ -250,21 +284,33 @@ def postprocess_html(
                 caption_info.caption,
             )
             continue
-        target_element.attrib["title"] = caption_info.caption
-        custom_figure_attrib[target_element] = caption_info.attributes
+        # The figure caption replaces the title of the image
+        target_element.attrib.pop("title", None)
+        figure_captions[target_element] = caption_info
 
     # Iterate through all images and wrap them in a figure element if requested
-    index = config.start_index
-    img_elements = tree.xpath("//p/a/img|//p/img")
+    index = indices.get("figure", config.start_index)
+    if elements is None:
+        img_elements = collect_page_elements(tree, caption_tags=()).images
+    else:
+        img_elements = [
+            img_element
+            for img_element in elements.images
+            if _is_figure_candidate(img_element, tree)
+        ]
     img_iter = iter(img_elements)
     for img_element in img_iter:
-        figure_attrib = custom_figure_attrib.get(img_element, {})
+        figure_caption = figure_captions.get(img_element)
         if img_element.attrib.get("class") in config.ignore_classes:
             continue
         siblings = _get_siblings(img_element, config=config, img_iter=img_iter)
         # We pop the title here so its not duplicated in the img element
-        title = img_element.attrib.pop("title", None)
-        if title is None:
+        title: str | list[TreeElement] | None = img_element.attrib.pop("title", None)
+        figure_attrib: dict[str, str] = {}
+        if figure_caption is not None:
+            title = figure_caption.caption_elements
+            figure_attrib = figure_caption.attributes
+        elif title is None:
             # Use the alt text if provided
             title = img_element.get("alt", None)
             if (
@@ -277,7 +323,6 @@ def postprocess_html(
             img_element=img_element,
             title=title,
             config=config,
-            logger=logger,
             index=index,
             figure_attrib=figure_attrib,
             page=page,
@@ -285,3 +330,4 @@ def postprocess_html(
             siblings=siblings,
         )
         index += config.increment_index
+    indices["figure"] = index
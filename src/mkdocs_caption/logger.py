@@ -2,6 +2,7 @@
 
 from __future__ import annotations
 
+import contextlib
 import logging
 import typing as t
 
@@ -38,6 +39,43 @@ class PluginLogger(logging.LoggerAdapter):
         return f"{self._prefix}: {self._filename}: {msg}", kwargs
 
 
+class WarningCounter(logging.Filter):
+    """A logging filter that counts the warnings and errors it sees."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.count = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """Count the record if it is a warning or an error.
+
+        Args:
+            record: The log record.
+
+        Returns:
+            Always True, the record is not filtered.
+        """
+        if record.levelno >= logging.WARNING:
+            self.count += 1
+        return True
+
+
+@contextlib.contextmanager
+def count_warnings() -> t.Iterator[WarningCounter]:
+    """Count the warnings and errors the plugin logs within the context.
+
+    Yields:
+        The counter of the warnings and errors.
+    """
+    logger = logging.getLogger("mkdocs.plugins.mkdocs_caption")
+    counter = WarningCounter()
+    logger.addFilter(counter)
+    try:
+        yield counter
+    finally:
+        logger.removeFilter(counter)
+
+
 def get_logger(filename: str) -> PluginLogger:
     """Return a logger for plugins.
 
@@ -1,14 +1,102 @@
 """MkDocs plugin for custom image and table captions."""
 
+from __future__ import annotations
+
+import copy
+import json
+import re
+from collections import Counter
+from functools import lru_cache, partial
+from pathlib import Path
+from typing import TYPE_CHECKING
+
 from lxml import etree
-from mkdocs.config.defaults import MkDocsConfig
 from mkdocs.plugins import BasePlugin, event_priority
-from mkdocs.structure.pages import Page
 
-from mkdocs_caption import config, custom, image, table
-from mkdocs_caption.logger import get_logger
+from mkdocs_caption import config, custom, engine, image, prefetch, prescan, table
+from mkdocs_caption.cache import PageCache
+from mkdocs_caption.helper import MarkdownCaptionTarget, wrap_md_captions
+from mkdocs_caption.logger import count_warnings, get_logger
 from mkdocs_caption.post_processor import PostProcessor
 
+if TYPE_CHECKING:
+    from mkdocs.config.defaults import MkDocsConfig
+    from mkdocs.structure.files import File, Files
+    from mkdocs.structure.pages import Page
+    from mkdocs.utils.templates import TemplateContext
+
+    from mkdocs_caption.cache import Entry
+
+
+@lru_cache(maxsize=8)
+def _compile_postprocess_check(tags: tuple[str, ...]) -> re.Pattern:
+    """Compile a pattern that finds any of the given html tags.
+
+    HTML tags are case-insensitive, so raw HTML like `<IMG>` matches as well.
+
+    Args:
+        tags: The html tags that require postprocessing.
+
+    Returns:
+        The compiled pattern.
+    """
+    return re.compile(
+        "|".join(rf"<{re.escape(tag)}\b" for tag in tags),
+        re.IGNORECASE,
+    )
+
+
+def _needs_postprocessing(html: str, config: config.CaptionConfig) -> bool:
+    """Check if the html of a page requires postprocessing.
+
+    This is a cheap check that avoids parsing pages that neither contain a
+    caption element nor an image that could be captioned.
+
+    Args:
+        html: HTML rendered from Markdown source as string
+        config: The configuration for the page.
+
+    Returns:
+        True if the html needs to be postprocessed, False otherwise.
+    """
+    tags = []
+    if config.table.enable:
+        tags.append(table.TABLE_CAPTION_TAG)
+    if config.custom.enable:
+        tags.append(custom.CAPTION_TAG)
+    if config.figure.enable:
+        tags.extend((image.IMG_CAPTION_TAG, "img"))
+    if not tags:
+        return False
+    return _compile_postprocess_check(tuple(tags)).search(html) is not None
+
+
+def _get_markdown_targets(
+    global_config: config.CaptionConfig,
+    identifiers: list[str],
+) -> dict[str, MarkdownCaptionTarget]:
+    """Get the markdown identifiers of all captions mapped to their target.
+
+    All identifiers are wrapped in a single pass. Tables take precedence over
+    figures and figures over custom identifiers should they share the same
+    markdown identifier.
+
+    Args:
+        global_config: The global configuration.
+        identifiers: The additional identifiers of the page.
+
+    Returns:
+        The markdown identifiers mapped to their wrapping target.
+    """
+    return {
+        **custom.get_markdown_targets(
+            config=global_config.custom,
+            identifiers=identifiers,
+        ),
+        **image.get_markdown_targets(config=global_config.figure),
+        **table.get_markdown_targets(config=global_config.table),
+    }
+
 
 class CaptionPlugin(BasePlugin[config.CaptionConfig]):
     """A MkDocs plugin for custom image and table captions.
@@ -22,10 +110,43 @@ class CaptionPlugin(BasePlugin[config.CaptionConfig]):
         TODO
     """
 
+    # The merged configurations of pages with a page-specific configuration
+    _page_configs: dict[str, config.CaptionConfig]
+    # The cached pages that are kept in memory across the builds of `serve`
+    _memory: dict[str, Entry] | None = None
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._post_processor = PostProcessor()
+
+    def on_startup(self, *, command: str, **_) -> None:
+        """Keep the state of the plugin while `mkdocs serve` is running.
+
+        Defining the `startup` event makes MkDocs keep the plugin instance
+        across the rebuilds of `serve`. The post-processor is created once per
+        command, so the dependencies between the pages of one build are known
+        in the next one. The cached pages are kept in memory, so unchanged
+        pages are not preprocessed and captioned again. The references are
+        resolved in every build, so pages referencing captions whose number
+        changed are still updated.
+
+        Args:
+            command: The MkDocs command that is run.
+            dirty: Whether only changed files are built.
+        """
+        self._post_processor = PostProcessor()
+        self._memory = {} if command == "serve" else None
+
+    def on_shutdown(self) -> None:
+        """Release the cached pages and the dependencies once MkDocs exits."""
+        self._post_processor = PostProcessor()
+        self._memory = None
+
     def on_config(self, config: MkDocsConfig, **_) -> MkDocsConfig:
         """Called by MkDocs when parsing the config.
 
-        We just store the config for later use.
+        We just store the config for later use and create the HTML parser
+        that is shared by all pages.
 
         Args:
             config: The global configuration object.
@@ -34,13 +155,125 @@ class CaptionPlugin(BasePlugin[config.CaptionConfig]):
             The global configuration object.
         """
         self._config = config.plugins["caption"].config
-        self._post_processor = PostProcessor(self._config.cross_reference_text)
+        self._post_processor.configure(
+            self._config.cross_reference_text,
+            scope=self._config.cross_references,
+        )
+        self._stats: Counter[str] = Counter()
+        self._prefetched: dict[str, tuple[str, str, str | None]] = {}
+        self._page_configs = {}
+        self._cache: PageCache | None = None
+        directory = None
+        if self._config.cache.enable:
+            directory = (
+                Path(config.config_file_path or "mkdocs.yml").parent
+                / self._config.cache.directory
+            )
+        if directory is not None or self._memory is not None:
+            self._cache = PageCache(
+                directory,
+                self._config.cache.max_size * 1024 * 1024,
+                memory=self._memory,
+            )
+        self._parser = etree.HTMLParser()
         return config
 
+    @property
+    def stats(self) -> dict[str, int]:
+        """Statistics about the pages processed in the current build."""
+        return dict(self._stats)
+
+    @property
+    def post_processor(self) -> PostProcessor:
+        """The post-processor of the cross references of all builds."""
+        return self._post_processor
+
+    @property
+    def registry_stats(self) -> dict[str, int]:
+        """Statistics about the cross reference targets of the current build."""
+        return self._post_processor.stats
+
+    def on_files(self, files: Files, **_) -> Files:
+        """Preprocess all pages and prepare the prediction of their targets.
+
+        The `files` event is called once the documentation files were
+        collected. With `preprocess_workers` the markdown of all pages is
+        preprocessed in parallel. With `predict_references` the targets of a
+        page that is rendered later are predicted once it is referenced, so
+        the reference is filled while the referencing page is captioned. The
+        dependencies of pages that were deleted since the last build are
+        removed.
+
+        Args:
+            files: global files collection
+            config: global configuration object
+
+        Returns:
+            The global files collection.
+        """
+        self._post_processor.prune_dependencies(files.documentation_pages())
+        targets = _get_markdown_targets(
+            self._config,
+            self._config.additional_identifier,
+        )
+        if self._config.preprocess_workers > 0:
+            self._prefetched = prefetch.prefetch_markdown(
+                files.documentation_pages(),
+                targets=targets,
+                workers=self._config.preprocess_workers,
+            )
+        if self._config.predict_references:
+            self._post_processor.expect_pages(
+                files.documentation_pages(),
+                predict=partial(self._predict_page, targets=targets),
+            )
+        return files
+
+    def _predict_page(
+        self,
+        file: File,
+        *,
+        targets: dict[str, MarkdownCaptionTarget],
+    ) -> tuple[str, dict[str, str]] | None:
+        """Predict the title and the targets of a page that is not rendered yet.
+
+        The prefetched markdown of the page is used if available, so the file
+        is not read again. Otherwise the page is preprocessed like in
+        `on_files` and the result is kept for `on_page_markdown`, so the
+        markdown is only wrapped once.
+
+        Args:
+            file: The file of the page.
+            targets: The global markdown identifiers mapped to their wrapping
+                target.
+
+        Returns:
+            The title and the reference text of each target by its id or None
+            if the page can not be predicted.
+        """
+        prefetched = self._prefetched.get(file.src_path)
+        if prefetched is None:
+            prefetched = prefetch.preprocess_source(
+                file.content_string,
+                targets=targets,
+            )
+            if prefetched is None:
+                # Pages with their own configuration are resolved once rendered.
+                return None
+            self._prefetched[file.src_path] = prefetched
+        return prescan.guess_title(file, prefetched[2]), prescan.scan_wrapped_markdown(
+            prefetched[1],
+            config=self._config,
+        )
+
     def _get_config(self, page: Page) -> config.CaptionConfig:
         """Get the configuration for a page.
 
         This is done by merging the global configuration with the page-specific.
+        Pages without a page-specific configuration share the global one. The
+        merged configurations are cached by their page-specific part, so pages
+        with the same overrides share them as well. The returned configuration
+        must not be changed.
 
         Args:
             page: current page
@@ -48,8 +281,16 @@ class CaptionPlugin(BasePlugin[config.CaptionConfig]):
         Returns:
             The configuration for the page.
         """
-        page_config = page.meta.get("caption", {})
-        return config.update_config(self._config.copy(), page_config)
+        page_config = page.meta.get("caption")
+        if not page_config:
+            return self._config
+        key = json.dumps(page_config, sort_keys=True, default=str)
+        snapshot = self._page_configs.get(key)
+        if snapshot is None:
+            # A deep copy since the global sub configurations must not change.
+            snapshot = config.update_config(copy.deepcopy(self._config), page_config)
+            self._page_configs[key] = snapshot
+        return snapshot
 
     @event_priority(-100)
     def on_page_markdown(self, markdown: str, *, page: Page, **_) -> str:
@@ -70,33 +311,56 @@ class CaptionPlugin(BasePlugin[config.CaptionConfig]):
         """
         logger = get_logger(page.file.src_path)
         config = self._get_config(page)
+        key = None
+        if self._cache is not None and self._memory is not None:
+            # Only kept in memory since wrapping is cheaper than reading a file.
+            key = self._cache.key(markdown, config, kind="markdown")
+            entry = self._cache.get(key, persistent=False)
+            if entry is not None:
+                return entry[0]
         try:
-            markdown = table.preprocess_markdown(markdown, config=self._config.table)
-        except Exception as e:  # noqa: BLE001  # pragma: no cover
-            logger.error(
-                "Unexpected Error while preprocessing the tables, skipping: %s",
-                e,
-            )
-        try:
-            markdown = image.preprocess_markdown(markdown, config=self._config.figure)
-        except Exception as e:  # noqa: BLE001  # pragma: no cover
-            logger.error(
-                "Unexpected Error while preprocessing the images, skipping: %s",
-                e,
-            )
-        try:
-            markdown = custom.preprocess_markdown(
-                markdown,
-                config=self._config.custom,
-                identifiers=config.additional_identifier,
-            )
+            wrapped = self._wrap_markdown(markdown, page=page, config=config)
         except Exception as e:  # noqa: BLE001  # pragma: no cover
             logger.error(
-                "Unexpected Error while preprocessing the custom, skipping: %s",
+                "Unexpected Error while preprocessing the captions, skipping: %s",
                 e,
             )
+            return markdown
+        if key is not None and self._cache is not None:
+            self._cache.put(key, wrapped, {}, persistent=False)
+        return wrapped
+
+    def _wrap_markdown(
+        self,
+        markdown: str,
+        *,
+        page: Page,
+        config: config.CaptionConfig,
+    ) -> str:
+        """Wrap the caption identifiers in the Markdown content of a page.
 
-        return markdown
+        The Markdown preprocessed in `on_files` or to predict the targets of
+        the page is only used if the page has no page-specific configuration
+        and no other plugin changed it since.
+
+        Args:
+            markdown: Markdown source text of page as string
+            page: `mkdocs.nav.Page` instance
+            config: The configuration for the page.
+
+        Returns:
+            The wrapped Markdown content of the page.
+        """
+        prefetched = self._prefetched.pop(page.file.src_path, None)
+        if (
+            prefetched is not None
+            and config is self._config
+            and prefetched[0] == prefetch.digest(markdown)
+        ):
+            self._stats["prefetched_pages"] += 1
+            return prefetched[1]
+        targets = _get_markdown_targets(self._config, config.additional_identifier)
+        return wrap_md_captions(markdown, targets=targets)
 
     def on_page_content(self, html: str, *, page: Page, **_) -> str:
         """Process the HTML content of a rendered page.
@@ -114,54 +378,160 @@ class CaptionPlugin(BasePlugin[config.CaptionConfig]):
         Returns:
             The processed HTML content of the page.
         """
-        logger = get_logger(page.file.src_path)
+        self._stats["pages"] += 1
+        html = self._caption_content(html, page=page)
+        if self._config.cross_references == "off":
+            return html
+        self._post_processor.collect_references(page, html)
+        if self._config.cross_references == "local":
+            # All targets a page can reference are known once it was captioned.
+            html = self._post_processor.post_process(page, html)
+        return html
+
+    def _caption_content(self, html: str, *, page: Page) -> str:
+        """Apply the captions to the HTML content of a page.
+
+        Args:
+            html: HTML rendered from Markdown source as string
+            page: `mkdocs.nav.Page` instance
+
+        Returns:
+            The processed HTML content of the page.
+        """
         config = self._get_config(page)
+        if not _needs_postprocessing(html, config):
+            self._stats["fast_path_pages"] += 1
+            return html
+        if self._cache is None:
+            return self._apply_engine(html, page=page, config=config)
+        key = self._cache.key(html, config)
+        entry = self._cache.get(key)
+        if entry is not None:
+            self._stats["cached_pages"] += 1
+            content, targets = entry
+            for identifier, text in targets:
+                self._post_processor.register_target(identifier, text, page)
+        else:
+            # The references are not filled since they depend on other pages.
+            with count_warnings() as warnings:
+                content = self._apply_engine(html, page=page, config=config, fill=False)
+            # Pages with warnings are not cached so the warnings are logged (and
+            # fail strict builds) in every build.
+            if content is not html and not warnings.count:
+                self._cache.put(key, content, self._post_processor.page_targets(page))
+        if self._config.predict_references:
+            # Filled in the cached content, so it is the same as without cache.
+            content = self._post_processor.fill_content(page, content)
+        return content
+
+    def _apply_engine(
+        self,
+        html: str,
+        *,
+        page: Page,
+        config: config.CaptionConfig,
+        fill: bool = True,
+    ) -> str:
+        """Apply the captions to the HTML content of a page with an engine.
+
+        Args:
+            html: HTML rendered from Markdown source as string
+            page: `mkdocs.nav.Page` instance
+            config: The configuration for the page.
+            fill: Whether to fill the references of the page.
+
+        Returns:
+            The processed HTML content of the page.
+        """
+        logger = get_logger(page.file.src_path)
         try:
-            parser = etree.HTMLParser()
-            tree = etree.fromstring(html, parser)
-            if tree is None:  # pragma: no cover
-                return html
-            table.postprocess_html(
-                tree=tree,
-                config=config["table"],
+            if engine.select_engine(self._config.engine, html) == "stream":
+                self._stats["stream_pages"] += 1
+                return engine.postprocess_stream(
+                    html,
+                    config=config,
+                    page=page,
+                    post_processor=self._post_processor,
+                    logger=logger,
+                    fill_references=fill,
+                )
+            return engine.postprocess_dom(
+                html,
+                parser=self._parser,
+                config=config,
                 page=page,
                 post_processor=self._post_processor,
                 logger=logger,
+                fill_references=fill,
             )
-            custom.postprocess_html(
-                tree=tree,
-                config=config["custom"],
-                logger=logger,
-                page=page,
-                post_processor=self._post_processor,
-            )
-            image.postprocess_html(
-                tree=tree,
-                config=config["figure"],
-                page=page,
-                post_processor=self._post_processor,
-                logger=logger,
-            )
-            html_result = etree.tostring(tree, encoding="unicode", method="html")
-            # HTMLParser adds <html><body> tags, remove them
-            return html_result[len("<html><body>") : -len("</body></html>")]
         except Exception as e:  # noqa: BLE001  # pragma: no cover
             logger.error("Unexpected Error skipping: %s", e)
             return html
 
-    def on_post_page(self, output: str, page: Page, **_) -> str:
-        """Process the output of a page after it has been rendered.
+    def on_page_context(
+        self,
+        context: TemplateContext,
+        *,
+        page: Page,
+        **_,
+    ) -> TemplateContext:
+        """Resolve the references in the content of a page.
 
-        The `post_page` event is called after the page has been rendered to HTML
-        and can be used to alter the final output.
+        The `page_context` event is called after the content of all pages was
+        rendered, so all targets are known. Only the content of the page is
+        searched for references, the navigation and all other parts of the
+        theme are not.
 
         Args:
-            output: HTML content of the page as string
+            context: dict of template context variables
             page: `mkdocs.nav.Page` instance
             config: global configuration object
-            files: global files collection
+            nav: global navigation object
 
         Returns:
-            The processed output of the page.
+            The template context.
+        """
+        if self._config.cross_references == "global" and page.content is not None:
+            # Empty pages are post-processed as well to drop their dependencies.
+            page.content = self._post_processor.post_process(page, page.content)
+        return context
+
+    def on_build_error(self, **_) -> None:
+        """Release the targets of a build that failed.
+
+        The post-processor outlives the build, so the targets of the failed
+        build must not leak into the next one.
+
+        Args:
+            error: exception raised
         """
-        return self._post_processor.post_process(page, output)
+        self._post_processor.clear()
+
+    def on_post_build(self, **_) -> None:
+        """Report statistics and release the targets after the build.
+
+        The `post_build` event is called after the build has finished. The
+        targets are released so they neither stay in memory while `mkdocs
+        serve` waits for changes nor leak into the next build.
+
+        Args:
+            config: global configuration object
+        """
+        self._prefetched = {}
+        if self._cache is not None:
+            self._cache.prune()
+            get_logger("build").info(
+                "Cache: %(hits)d hits (%(memory_hits)d in memory), %(misses)d "
+                "misses, %(writes)d writes, %(evictions)d evicted, %(size)d bytes",
+                self._cache.reset_stats(),
+            )
+        get_logger("build").debug(
+            "%d of %d pages contained nothing to caption",
+            self._stats["fast_path_pages"],
+            self._stats["pages"],
+        )
+        get_logger("build").debug(
+            "Cross references: %s",
+            self.registry_stats,
+        )
+        self._post_processor.clear()
@@ -0,0 +1,45 @@
+"""Run tasks in a pool of worker processes."""
+
+from __future__ import annotations
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, TypeVar
+
+T = TypeVar("T")
+
+
+def map_tasks(
+    function: Callable[..., T],
+    tasks: list[tuple[Any, ...]],
+    *,
+    workers: int,
+) -> list[T]:
+    """Call a function with the arguments of each task.
+
+    The tasks are distributed over the worker processes in chunks. The
+    function and its arguments must be picklable.
+
+    Args:
+        function: The function to call.
+        tasks: The positional arguments of each call.
+        workers: The number of worker processes. The function is called in
+            the current process if this is 1 or there is only one task.
+
+    Returns:
+        The result of each task in the order of the tasks.
+    """
+    if workers <= 1 or len(tasks) <= 1:
+        return [function(*task) for task in tasks]
+    # Spawned workers do not inherit the threads of `mkdocs serve`.
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+    ) as executor:
+        return list(
+            executor.map(
+                function,
+                *zip(*tasks),
+                chunksize=max(1, len(tasks) // (workers * 4)),
+            ),
+        )
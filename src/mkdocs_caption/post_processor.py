@@ -2,12 +2,74 @@
 
 from __future__ import annotations
 
+import html
 import re
-from typing import TYPE_CHECKING
+import sys
+from functools import partial
+from typing import TYPE_CHECKING, Callable
 
 if TYPE_CHECKING:
+    import xml.etree.ElementTree as ET
+    from collections.abc import Iterable
+
+    from mkdocs.structure.files import File
     from mkdocs.structure.pages import Page
 
+    from mkdocs_caption.helper import TreeElement
+
+# An anchor with a plain text that may reference a caption. The groups are the
+# path and the identifier of the href and the text of the anchor.
+_ANCHOR_RE = re.compile(
+    r'<a\b[^>]*?\bhref="([^"#]*)#([^"]*)"[^>]*>([^<]*)(?=</a>)',
+)
+
+
+def _replace_references(
+    content: str,
+    texts: dict[tuple[str, str, str], str],
+    resolve: Callable[[tuple[str, str]], str | None] | None = None,
+) -> tuple[str, int, int]:
+    """Replace the text of the anchors in a single pass over the content.
+
+    Args:
+        content: The content to search.
+        texts: The new text of each anchor by its path, identifier and current
+            text.
+        resolve: Resolves the path and identifier of empty anchors that have
+            no new text.
+
+    Returns:
+        The new content and the number of resolved and corrected references.
+    """
+    parts: list[str] = []
+    position = resolved = corrected = 0
+    for match in _ANCHOR_RE.finditer(content):
+        text = texts.get((match[1], match[2], match[3]))
+        if text is None and resolve is not None and not match[3]:
+            text = resolve((match[1], match[2]))
+        if text is None:
+            continue
+        if match[3]:
+            corrected += 1
+        else:
+            resolved += 1
+        parts.extend((content[position : match.start(3)], text))
+        position = match.end()
+    if not parts:
+        return content, 0, 0
+    parts.append(content[position:])
+    return "".join(parts), resolved, corrected
+
+
+class _PageTargets:
+    """The targets registered on a page."""
+
+    __slots__ = ("texts", "title")
+
+    def __init__(self, title: str) -> None:
+        self.title = title
+        self.texts: dict[str, str] = {}
+
 
 class PostProcessor:
     """Global post-processor for MkDocs pages.
@@ -15,51 +77,369 @@ class PostProcessor:
     This post proccessor implements all global post-processing steps for the
     MkDocs caption. Global post-processing steps are steps that are applied to
     all pages and require information from different pages to be applied.
+
+    Args:
+        cross_reference_text: The text of references to other pages.
+        scope: The references that are resolved. `global` resolves references
+            to all pages, `local` only references within a page and `off` none
+            at all. No targets are registered if the scope is `off`.
     """
 
-    def __init__(self, cross_reference_text: str = "{local_ref}") -> None:
-        self._regex_to_apply: dict[str, tuple[re.Pattern, str]] = {}
-        self._local_regex: dict[str, list[tuple[re.Pattern, str]]] = {}
-        self._global_regex: re.Pattern | None = None
+    def __init__(
+        self,
+        cross_reference_text: str = "{local_ref}",
+        *,
+        scope: str = "global",
+    ) -> None:
+        self._pages: dict[str, _PageTargets] = {}
+        self._cross_reference_text = cross_reference_text
+        self._scope = scope
+        self._references: dict[str, frozenset[tuple[str, str]]] = {}
+        self._predictions: dict[str, _PageTargets] = {}
+        self._predicted_fills: dict[str, dict[tuple[str, str], str]] = {}
+        # The pages that are predicted once a reference to them is found.
+        self._unpredicted: dict[str, File] = {}
+        self._predict: Callable[[File], tuple[str, dict[str, str]] | None] | None = None
+        self._predicted = 0
+        # The target pages of the references resolved on each page in the
+        # current build and the dependency graph of the last post-processing
+        # of each page in both directions.
+        self._resolved_pages: dict[str, set[str]] = {}
+        self._dependencies: dict[str, set[str]] = {}
+        self._dependents: dict[str, set[str]] = {}
+        self._resolved = 0
+        self._skipped = 0
+        self._filled = 0
+        self._corrected = 0
+        self._generation = 0
+
+    def configure(self, cross_reference_text: str, *, scope: str) -> None:
+        """Update the settings before a build.
+
+        The targets and references of the current build are not affected.
+
+        Args:
+            cross_reference_text: The text of references to other pages.
+            scope: The references that are resolved.
+        """
         self._cross_reference_text = cross_reference_text
+        self._scope = scope
+
+    def clear(self) -> None:
+        """Remove all targets once a build has finished.
+
+        The targets of a page are referenced by pages that are post-processed
+        later in the same build, so they can only be released together. Every
+        build starts a new generation. The dependencies between the pages are
+        kept, so the next build can tell which pages a change affects.
+        """
+        self._pages = {}
+        self._references = {}
+        self._predictions = {}
+        self._predicted_fills = {}
+        self._unpredicted = {}
+        self._predict = None
+        self._predicted = 0
+        self._resolved_pages = {}
+        self._resolved = 0
+        self._skipped = 0
+        self._filled = 0
+        self._corrected = 0
+        self._generation += 1
+
+    @staticmethod
+    def _page_path(page: Page) -> str:
+        """Get the path of a page as used in the href of a reference.
+
+        Args:
+            page: The page.
+
+        Returns:
+            The path of the page.
+        """
+        return f"{page.file.src_path[:-3]}.html"
 
     def register_target(self, identifier: str, text: str, page: Page) -> None:
         """Register a new href target.
 
+        Only the text of the target is stored. The cross reference text is
+        created once a reference to the target is found. Identifiers like
+        `_table-1` repeat on many pages and are interned.
+
         Args:
             identifier: The identifier of the target.
             text: The text to replace the identifier with.
             page: The page the target is on.
         """
-        self._global_regex = None
-        target_text = self._cross_reference_text.replace(
-            "{page_title}",
-            page.title,
-        ).replace("{local_ref}", text)
-        self._regex_to_apply[rf'{page.file.src_path[:-3]}.html#{identifier}"'] = (
-            re.compile(
-                rf'({re.escape(page.file.src_path[:-3])}.html#{identifier}"[^>]*?>)(<\/a>)',
-                flags=re.MULTILINE | re.DOTALL,
-            ),
-            rf"\1{target_text}\2",
-        )
-        if page.file.src_uri not in self._local_regex:
-            self._local_regex[page.file.src_uri] = []
-        self._local_regex[page.file.src_uri].append(
-            (
-                re.compile(
-                    rf'("#{identifier}"[^>]*?>)(<\/a>)',
-                    flags=re.MULTILINE | re.DOTALL,
-                ),
-                rf"\1{text}\2",
-            ),
+        if self._scope == "off":
+            return
+        path = self._page_path(page)
+        page_targets = self._pages.get(path)
+        if page_targets is None:
+            page_targets = self._pages[sys.intern(path)] = _PageTargets(page.title)
+        page_targets.texts[sys.intern(identifier)] = text
+
+    def page_targets(self, page: Page) -> dict[str, str]:
+        """Get the targets registered on a page.
+
+        Args:
+            page: The page.
+
+        Returns:
+            The text of each target by its identifier.
+        """
+        page_targets = self._pages.get(self._page_path(page))
+        return {} if page_targets is None else dict(page_targets.texts)
+
+    def referencing_pages(self, page: Page) -> set[str]:
+        """Get the pages that must be post-processed again if a page changes.
+
+        These are the pages with a reference to a target of the page that was
+        resolved when they were last post-processed. Their references have to
+        be resolved again once the targets or the title of the page change.
+        References that did not resolve to any target are not included.
+
+        Args:
+            page: The page whose targets changed.
+
+        Returns:
+            The paths of the referencing pages.
+        """
+        return set(self._dependents.get(self._page_path(page), ()))
+
+    def referenced_pages(self, page: Page) -> set[str]:
+        """Get the pages with a target that a page referenced.
+
+        Args:
+            page: The referencing page.
+
+        Returns:
+            The paths of the referenced pages as of the last post-processing
+            of the page.
+        """
+        return set(self._dependencies.get(self._page_path(page), ()))
+
+    def predict_targets(self, file: File, title: str, texts: dict[str, str]) -> None:
+        """Register the predicted targets of a page that is not rendered yet.
+
+        References to predicted targets are filled while the referencing page
+        is rendered and verified once all pages were rendered.
+
+        Args:
+            file: The file of the page.
+            title: The predicted title of the page.
+            texts: The predicted text of each target by its identifier.
+        """
+        if not texts or self._scope != "global":
+            return
+        page_targets = _PageTargets(title)
+        page_targets.texts = {sys.intern(key): text for key, text in texts.items()}
+        self._predictions[sys.intern(f"{file.src_path[:-3]}.html")] = page_targets
+
+    def expect_pages(
+        self,
+        files: Iterable[File],
+        *,
+        predict: Callable[[File], tuple[str, dict[str, str]] | None],
+    ) -> None:
+        """Register the pages whose targets may be predicted.
+
+        A page is only predicted once an empty reference to it can not be
+        filled with the registered targets, so sites without such references
+        do not pay for the prediction.
+
+        Args:
+            files: The files of the documentation pages.
+            predict: Predicts the title and the targets of a page or returns
+                None if the page can not be predicted.
+        """
+        if self._scope != "global":
+            return
+        self._predict = predict
+        self._unpredicted = {
+            sys.intern(f"{file.src_path[:-3]}.html"): file for file in files
+        }
+
+    def prune_dependencies(self, files: Iterable[File]) -> None:
+        """Remove the dependencies of pages that no longer exist.
+
+        The dependencies are kept across builds, so pages that were deleted
+        since the last build are dropped once the files of the next build
+        were collected.
+
+        Args:
+            files: The files of the documentation pages.
+        """
+        paths = {f"{file.src_path[:-3]}.html" for file in files}
+        dependencies = {}
+        for page_path, target_paths in self._dependencies.items():
+            if page_path in paths and (retained := target_paths & paths):
+                dependencies[page_path] = retained
+        self._dependencies = dependencies
+        self._dependents = {}
+        for page_path, target_paths in dependencies.items():
+            for target_path in target_paths:
+                self._dependents.setdefault(target_path, set()).add(page_path)
+
+    def _predict_page(self, path: str) -> None:
+        """Predict the targets of the pages a href path may point to.
+
+        Pages that were rendered already are not predicted. Every page is
+        predicted at most once per build. A page whose prediction fails is
+        resolved once it was rendered, like a page that is not predicted.
+
+        Args:
+            path: The path of the href.
+        """
+        start = 0
+        while start >= 0:
+            file = self._unpredicted.pop(path[start:], None)
+            if (
+                file is not None
+                and self._predict is not None
+                and path[start:] not in self._pages
+            ):
+                self._predicted += 1
+                try:
+                    prediction = self._predict(file)
+                except Exception:  # noqa: BLE001
+                    prediction = None
+                if prediction is not None:
+                    self.predict_targets(file, *prediction)
+            start = path.find("/", start) + 1 or -1
+
+    def fill_references(
+        self,
+        page: Page,
+        anchors: Iterable[TreeElement | ET.Element],
+    ) -> None:
+        """Fill the empty anchors of a page with the text of their target.
+
+        Targets that were already registered are used as they are, all others
+        are looked up in the predicted targets. The expected pages a reference
+        points to are predicted on first use. References filled from a
+        prediction are verified when the page is post-processed. Texts that
+        would be escaped are left to the post-processing, which inserts them
+        verbatim.
+
+        Args:
+            page: The page the anchors are on.
+            anchors: The anchor elements of the rendered content.
+        """
+        if self._scope == "off":
+            return
+        page_path = self._page_path(page)
+        for anchor in anchors:
+            href = anchor.get("href")
+            if anchor.text or len(anchor) or not href or "#" not in href:
+                continue
+            path, _, identifier = href.partition("#")
+            text = self._fill(page_path, (path, identifier))
+            if text is not None:
+                anchor.text = text
+
+    def fill_content(self, page: Page, content: str) -> str:
+        """Fill the empty references in the serialized content of a page.
+
+        This fills the references like `fill_references` for content that is
+        not parsed, e.g. because it was taken from the cache.
+
+        Args:
+            page: The page the content belongs to.
+            content: The rendered content of the page.
+
+        Returns:
+            The content with the filled references.
+        """
+        if self._scope == "off":
+            return content
+        fill = partial(self._fill, self._page_path(page))
+        return _replace_references(content, {}, fill)[0]
+
+    def _fill(self, page_path: str, reference: tuple[str, str]) -> str | None:
+        """Get the text to fill an empty reference with.
+
+        Args:
+            page_path: The path of the referencing page.
+            reference: The path and identifier of the href.
+
+        Returns:
+            The text or None if the reference is left to the post-processing.
+        """
+        path = reference[0]
+        if path and self._scope != "global":
+            return None
+        target = self._lookup(page_path, reference, self._pages)
+        predicted = target is None
+        if predicted:
+            if path and self._unpredicted:
+                self._predict_page(path)
+            target = self._lookup(page_path, reference, self._predictions)
+        if target is None or html.escape(target[1], quote=False) != target[1]:
+            return None
+        self._filled += 1
+        if predicted:
+            self._predicted_fills.setdefault(page_path, {})[reference] = target[1]
+        else:
+            self._add_dependency(page_path, target[0])
+        return target[1]
+
+    def _lookup(
+        self,
+        page_path: str,
+        reference: tuple[str, str],
+        pages: dict[str, _PageTargets],
+    ) -> tuple[str, str] | None:
+        """Get the text of a reference from the registered or predicted targets.
+
+        Args:
+            page_path: The path of the referencing page.
+            reference: The path and identifier of the href.
+            pages: The registered or the predicted targets by their page path.
+
+        Returns:
+            The path of the target page and the text or None if the reference
+            has no target.
+        """
+        path, identifier = reference
+        if path:
+            return self._find_target(path, identifier, pages)
+        page_targets = pages.get(page_path)
+        if page_targets is None or identifier not in page_targets.texts:
+            return None
+        return page_path, page_targets.texts[identifier]
+
+    def collect_references(self, page: Page, content: str) -> None:
+        """Record the references in the rendered content of a page.
+
+        The references are the path and identifier of each anchor that is
+        still empty. Only these are resolved when the page is post-processed.
+        Pages without any reference are not searched at all.
+
+        Args:
+            page: The page the content belongs to.
+            content: The rendered content of the page.
+        """
+        self._references[self._page_path(page)] = frozenset(
+            (match[1], match[2])
+            for match in _ANCHOR_RE.finditer(content)
+            if not match[3]
         )
 
     def post_process(self, page: Page, content: str) -> str:
         """Post-process the content of a page.
 
         The postprocessing replaces the empty href targets with the correct
-        text.
+        text. All references are resolved in a single pass over the content.
+        References within the page use the text of the target as is. If the
+        references of the page were collected, the page is only searched if
+        any of them has a target or a reference was filled from a prediction
+        that turned out to be wrong. Such a reference gets the text of its
+        actual target or is emptied again if there is none.
+
+        If the scope is `local`, the page has to be post-processed once it was
+        captioned. Its targets are released afterwards since no other page
+        can reference them.
 
         Args:
             page: The page to post-process.
@@ -68,24 +448,196 @@ class PostProcessor:
         Returns:
             The post-processed content.
         """
-        for local_regex, target in self._local_regex.get(page.file.src_uri, []):
-            content = local_regex.sub(target, content)
-
-        if self._global_regex is None:
-            self._global_regex = re.compile(
-                r"|".join(re.escape(regex) for regex in self._regex_to_apply),
-            )
-        result = content
-        for found in self._global_regex.finditer(content):
-            potential_match = found.group()
-            if potential_match not in self._regex_to_apply:  # pragma: no cover
-                continue
-            regex, replacement = self._regex_to_apply[potential_match]
-            result = regex.sub(replacement, result)
+        if self._scope == "off":
+            return content
+        page_path = self._page_path(page)
+        local_targets = self._local_targets(page_path)
+        texts, collected = self._replacements(page_path, local_targets)
+        if collected and not texts:
+            self._skipped += 1
+            self._update_dependencies(page_path)
+            return content
+        resolve = (
+            None
+            if collected
+            else partial(self._resolve, page_path, local_targets=local_targets)
+        )
+        content, resolved, corrected = _replace_references(content, texts, resolve)
+        self._resolved += resolved
+        self._corrected += corrected
+        self._update_dependencies(page_path)
+        return content
+
+    def _local_targets(self, page_path: str) -> dict[str, str]:
+        """Get the targets of a page for its post-processing.
+
+        If the scope is `local`, the targets are released since no other page
+        can reference them.
 
-        return result
+        Args:
+            page_path: The path of the page.
+
+        Returns:
+            The text of each target of the page by its identifier.
+        """
+        if self._scope == "local":
+            page_targets = self._pages.pop(page_path, None)
+        else:
+            page_targets = self._pages.get(page_path)
+        return {} if page_targets is None else page_targets.texts
+
+    def _replacements(
+        self,
+        page_path: str,
+        local_targets: dict[str, str],
+    ) -> tuple[dict[tuple[str, str, str], str], bool]:
+        """Get the new text of the anchors of a page.
+
+        Args:
+            page_path: The path of the page.
+            local_targets: The targets of the page.
+
+        Returns:
+            The new text of each anchor by its path, identifier and current
+            text and whether the references of the page were collected. Only
+            wrongly filled anchors are included if they were not.
+        """
+        texts = self._verify_predictions(page_path, local_targets)
+        references = self._references.pop(page_path, None)
+        if references is None:
+            return texts, False
+        for path, identifier in references:
+            text = self._resolve(page_path, (path, identifier), local_targets)
+            if text is not None:
+                texts[path, identifier, ""] = text
+        return texts, True
+
+    def _verify_predictions(
+        self,
+        page_path: str,
+        local_targets: dict[str, str],
+    ) -> dict[tuple[str, str, str], str]:
+        """Verify the references of a page that were filled from a prediction.
+
+        Args:
+            page_path: The path of the page.
+            local_targets: The targets of the page.
+
+        Returns:
+            The actual text of each wrongly filled reference by its path,
+            identifier and predicted text. The text is empty if the reference
+            has no target.
+        """
+        corrections = {}
+        for reference, predicted in self._predicted_fills.pop(page_path, {}).items():
+            text = self._resolve(page_path, reference, local_targets)
+            if text != predicted:
+                corrections[(*reference, predicted)] = text or ""
+        return corrections
+
+    def _resolve(
+        self,
+        page_path: str,
+        reference: tuple[str, str],
+        local_targets: dict[str, str],
+    ) -> str | None:
+        """Get the text of a reference.
+
+        Args:
+            page_path: The path of the referencing page.
+            reference: The path and identifier of the href.
+            local_targets: The targets of the referencing page.
+
+        Returns:
+            The text or None if the reference has no target.
+        """
+        path, identifier = reference
+        if not path:
+            return local_targets.get(identifier)
+        if self._scope != "global":
+            return None
+        target = self._find_target(path, identifier, self._pages)
+        if target is None:
+            return None
+        self._add_dependency(page_path, target[0])
+        return target[1]
+
+    def _add_dependency(self, page_path: str, target_path: str) -> None:
+        """Record that a page references a target on another page.
+
+        Args:
+            page_path: The path of the referencing page.
+            target_path: The path of the page the target is on.
+        """
+        if target_path != page_path:
+            self._resolved_pages.setdefault(page_path, set()).add(target_path)
+
+    def _update_dependencies(self, page_path: str) -> None:
+        """Replace the dependencies of a page once it was post-processed.
+
+        Args:
+            page_path: The path of the post-processed page.
+        """
+        target_paths = self._resolved_pages.pop(page_path, set())
+        for target_path in self._dependencies.pop(page_path, set()) - target_paths:
+            dependents = self._dependents[target_path]
+            dependents.discard(page_path)
+            if not dependents:
+                del self._dependents[target_path]
+        for target_path in target_paths:
+            self._dependents.setdefault(target_path, set()).add(page_path)
+        if target_paths:
+            self._dependencies[page_path] = target_paths
+
+    def _find_target(
+        self,
+        path: str,
+        identifier: str,
+        pages: dict[str, _PageTargets],
+    ) -> tuple[str, str] | None:
+        """Find the cross reference text of the target a href points to.
+
+        The path of the href is relative to the referencing page. It matches
+        a target if it ends with the path of the target page. The longest
+        matching path wins.
+
+        Args:
+            path: The path of the href.
+            identifier: The identifier of the href.
+            pages: The registered or the predicted targets by their page path.
+
+        Returns:
+            The path of the target page and the cross reference text or None
+            if no target matches.
+        """
+        start = 0
+        while start >= 0:
+            page_targets = pages.get(path[start:])
+            if page_targets is not None and identifier in page_targets.texts:
+                text = self._cross_reference_text.replace(
+                    "{page_title}",
+                    page_targets.title,
+                ).replace("{local_ref}", page_targets.texts[identifier])
+                return path[start:], text
+            start = path.find("/", start) + 1 or -1
+        return None
+
+    @property
+    def targets(self) -> dict[str, dict[str, str]]:
+        """The text of each target by the page path and its identifier."""
+        return {path: targets.texts for path, targets in self._pages.items()}
 
     @property
-    def regex_to_apply(self) -> dict[str, tuple[re.Pattern, str]]:
-        """The regex to apply to the content of the pages."""
-        return self._regex_to_apply
+    def stats(self) -> dict[str, int]:
+        """Statistics about the registered targets and resolved references."""
+        return {
+            "pages": len(self._pages),
+            "targets": sum(len(targets.texts) for targets in self._pages.values()),
+            "resolved_references": self._resolved,
+            "skipped_pages": self._skipped,
+            "filled_references": self._filled,
+            "corrected_references": self._corrected,
+            "predicted_pages": self._predicted,
+            "dependencies": sum(map(len, self._dependencies.values())),
+            "generation": self._generation,
+        }
@@ -0,0 +1,132 @@
+"""Preprocess the markdown of all pages before they are rendered.
+
+MkDocs renders one page after the other, so the caption identifiers of each
+page are wrapped in the `page_markdown` event of the page. With the
+`preprocess_workers` option the markdown files of all pages are read, parsed
+and wrapped by a pool of worker processes once the files were collected
+instead. The workers only receive the path of each file and send back a
+digest of the markdown with the wrapped result and the title of the page,
+which is reused to predict the targets of the page. The result of a page is only
+used if its markdown did not change in the meantime, e.g. by another plugin,
+otherwise it is wrapped again.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from functools import partial
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from mkdocs.utils import meta
+
+from mkdocs_caption.helper import wrap_md_captions
+from mkdocs_caption.pool import map_tasks
+from mkdocs_caption.prescan import page_title
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    from mkdocs.structure.files import File
+
+    from mkdocs_caption.helper import MarkdownCaptionTarget
+
+
+def digest(markdown: str) -> str:
+    """Get the digest that identifies the markdown of a page.
+
+    Args:
+        markdown: The markdown of the page without the meta data.
+
+    Returns:
+        The digest of the markdown.
+    """
+    return hashlib.sha256(markdown.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def preprocess_source(
+    source: str,
+    *,
+    targets: dict[str, MarkdownCaptionTarget],
+) -> tuple[str, str, str | None] | None:
+    """Strip the meta data of a page and wrap its caption identifiers.
+
+    Args:
+        source: The markdown source of the page including the meta data.
+        targets: The markdown identifiers mapped to their wrapping target.
+
+    Returns:
+        The digest of the markdown without the meta data, the wrapped markdown
+        and the title of the page or None if the page has its own
+        configuration.
+    """
+    markdown, page_meta = meta.get_data(source)
+    if "caption" in page_meta:
+        return None
+    return (
+        digest(markdown),
+        wrap_md_captions(markdown, targets=targets),
+        page_title(markdown, page_meta),
+    )
+
+
+def _prefetch_file(
+    path: str,
+    *,
+    targets: dict[str, MarkdownCaptionTarget],
+) -> tuple[str, str, str | None] | None:
+    """Read a markdown file and wrap its caption identifiers.
+
+    Args:
+        path: The absolute path of the markdown file.
+        targets: The markdown identifiers mapped to their wrapping target.
+
+    Returns:
+        The result of `preprocess_source` or None if the file can not be read
+        or wrapped. Errors are reported once the page is wrapped again while
+        it is rendered.
+    """
+    try:
+        return preprocess_source(Path(path).read_text("utf-8-sig"), targets=targets)
+    except Exception:  # noqa: BLE001  # pragma: no cover
+        return None
+
+
+def prefetch_markdown(
+    files: Iterable[File],
+    *,
+    targets: dict[str, MarkdownCaptionTarget],
+    workers: int,
+) -> dict[str, tuple[str, str, str | None]]:
+    """Wrap the caption identifiers in the markdown of documentation pages.
+
+    Pages with their own configuration, whose content is not read from a
+    file or that can not be read are skipped.
+
+    Args:
+        files: The files of the documentation pages.
+        targets: The global markdown identifiers mapped to their wrapping
+            target.
+        workers: The number of worker processes. The markdown is wrapped in
+            the current process if this is 1.
+
+    Returns:
+        The digest of the markdown without the meta data, the wrapped markdown
+        and the title from the meta data or the first heading of each page by
+        its source path.
+    """
+    paths = {
+        file.src_path: file.abs_src_path
+        for file in files
+        if file.abs_src_path is not None
+    }
+    results = map_tasks(
+        partial(_prefetch_file, targets=targets),
+        [(path,) for path in paths.values()],
+        workers=workers,
+    )
+    return {
+        src_path: result
+        for src_path, result in zip(paths, results)
+        if result is not None
+    }
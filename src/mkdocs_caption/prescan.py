@@ -0,0 +1,131 @@
+"""Predict the cross reference targets of pages before they are rendered.
+
+The targets of a page are only known once its content was rendered. To fill
+references to pages that are rendered later right away, the targets of table
+and custom captions are predicted from the markdown of all pages. Figures are
+not predicted since their numbering depends on the images of the rendered
+page. A prediction can be wrong, e.g. for captions in code blocks or markdown
+changed by other plugins, and is therefore verified once all pages have been
+rendered. Pages are only predicted once a reference to them could not be
+filled otherwise.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from mkdocs.structure.pages import get_markdown_title
+
+from mkdocs_caption import custom, table
+from mkdocs_caption.helper import parse_caption_marker, wrap_md_captions
+
+if TYPE_CHECKING:
+    from mkdocs.structure.files import File
+
+    from mkdocs_caption.config import CaptionConfig
+    from mkdocs_caption.helper import MarkdownCaptionTarget
+
+_MARKER_PREFIXES = (f"<{table.TABLE_CAPTION_TAG} ", f"<{custom.CAPTION_TAG} ")
+
+
+def page_title(markdown: str, page_meta: dict) -> str | None:
+    """Get the title of a page from its meta data or its first heading.
+
+    Args:
+        markdown: The markdown of the page without the meta data.
+        page_meta: The meta data of the page.
+
+    Returns:
+        The title of the page or None if it is derived from the file name.
+    """
+    if "title" in page_meta:
+        return str(page_meta["title"])
+    return get_markdown_title(markdown)
+
+
+def guess_title(file: File, title: str | None) -> str:
+    """Guess the title of a page the way MkDocs determines it.
+
+    A title set in the navigation is not known yet and not considered.
+
+    Args:
+        file: The file of the page.
+        title: The title from the meta data or the first heading of the page.
+
+    Returns:
+        The title of the page.
+    """
+    if title is not None:
+        return title
+    if file.src_uri == "index.md":
+        return "Home"
+    title = file.name.replace("-", " ").replace("_", " ")
+    return title.capitalize() if title.lower() == title else title
+
+
+def scan_markdown(
+    markdown: str,
+    *,
+    config: CaptionConfig,
+    targets: dict[str, MarkdownCaptionTarget],
+) -> dict[str, str]:
+    """Predict the targets of the table and custom captions of a page.
+
+    The captions are wrapped like in `on_page_markdown` and numbered with the
+    same rules as in `postprocess_html`.
+
+    Args:
+        markdown: The markdown of the page without the meta data.
+        config: The configuration for the page.
+        targets: The markdown identifiers mapped to their wrapping target.
+
+    Returns:
+        The reference text of each target by its id.
+    """
+    return scan_wrapped_markdown(
+        wrap_md_captions(markdown, targets=targets),
+        config=config,
+    )
+
+
+def scan_wrapped_markdown(markdown: str, *, config: CaptionConfig) -> dict[str, str]:
+    """Predict the targets of a page whose captions are already wrapped.
+
+    Lines that look like a caption marker but can not be parsed as one, e.g.
+    html written in a code block, are skipped.
+
+    Args:
+        markdown: The wrapped markdown of the page.
+        config: The configuration for the page.
+
+    Returns:
+        The reference text of each target by its id.
+    """
+    texts = {}
+    indices: dict[str, int] = {}
+    for line in markdown.split("\n"):
+        marker = line.lstrip()
+        if not marker.startswith(_MARKER_PREFIXES):
+            continue
+        try:
+            tag, items = parse_caption_marker(marker)
+        except ValueError:
+            continue
+        attributes = dict(items)
+        if tag == table.TABLE_CAPTION_TAG:
+            identifier, identifier_config = "table", config.table
+        elif tag == custom.CAPTION_TAG and attributes.get("identifier"):
+            identifier, identifier_config = attributes["identifier"], config.custom
+        else:
+            continue
+        index = indices.get(identifier, identifier_config.start_index)
+        indices[identifier] = index + identifier_config.increment_index
+        target_id = attributes.get(
+            "id",
+            identifier_config.get_default_id(identifier=identifier, index=index),
+        )
+        texts[target_id] = identifier_config.get_reference_text(
+            identifier=identifier,
+            index=index,
+        )
+    return texts
@@ -8,7 +8,10 @@ from lxml import etree
 
 from mkdocs_caption.helper import (
     CaptionInfo,
+    MarkdownCaptionTarget,
+    PageElements,
     TreeElement,
+    create_caption_element,
     iter_caption_elements,
     wrap_md_captions,
 )
@@ -36,15 +39,29 @@ def preprocess_markdown(markdown: str, *, config: IdentifierCaption) -> str:
     Returns:
         markdown string with custom captions wrapped
     """
+    return wrap_md_captions(markdown, targets=get_markdown_targets(config=config))
+
+
+def get_markdown_targets(
+    *,
+    config: IdentifierCaption,
+) -> dict[str, MarkdownCaptionTarget]:
+    """Get the markdown identifiers that need to be wrapped.
+
+    Args:
+        config: plugin configuration for tables
+
+    Returns:
+        The markdown identifiers mapped to their wrapping target.
+    """
     if not config.enable:
-        return markdown
-    identifier = config.get_markdown_identifier("table")
-    return wrap_md_captions(
-        markdown,
-        identifier=identifier,
-        html_tag=TABLE_CAPTION_TAG,
-        allow_indented_caption=config.allow_indented_caption,
-    )
+        return {}
+    return {
+        config.get_markdown_identifier("table"): MarkdownCaptionTarget(
+            html_tag=TABLE_CAPTION_TAG,
+            allow_indented_caption=config.allow_indented_caption,
+        ),
+    }
 
 
 def _create_colgroups(coldef: str) -> TreeElement:
@@ -74,8 +91,7 @@ def _add_caption_to_table(
     *,
     index: int,
     config: IdentifierCaption,
-    logger: PluginLogger,
-) -> str | None:
+) -> str:
     """Add a caption to a table element in an XML tree.
 
     This function takes an XML tree, a table element, a caption element, and an
@@ -87,24 +103,16 @@ def _add_caption_to_table(
         tree: The root element of the XML tree.
         index: The index of the table element.
         config: The plugin configuration.
-        logger: Current plugin logger.
+
+    Returns:
+        The id of the table element.
     """
-    caption_prefix = config.get_caption_prefix(index=index, identifier="table")
-    try:
-        table_caption_element = etree.fromstring(
-            str(
-                f'<caption style="caption-side:{config.position}">'
-                f"{caption_prefix} {caption_info.caption}</caption>",
-            ),
-        )
-    except etree.XMLSyntaxError:
-        logger.error(
-            'Invalid XML in caption: <caption style="caption-side:%s">%s %s</caption>',
-            config.position,
-            caption_prefix,
-            caption_info.caption,
-        )
-        return None
+    table_caption_element = create_caption_element(
+        "caption",
+        prefix=config.get_caption_prefix(index=index, identifier="table"),
+        caption=caption_info.caption_elements,
+        attrib={"style": f"caption-side:{config.position}"},
+    )
     caption_info.target_element.insert(0, table_caption_element)
 
     if "cols" in caption_info.attributes:
@@ -129,6 +137,8 @@ def postprocess_html(
     page: Page,
     post_processor: PostProcessor,
     logger: PluginLogger,
+    elements: PageElements | None = None,
+    indices: dict[str, int] | None = None,
 ) -> None:
     """Handle custom captions in an XML tree.
 
@@ -141,11 +151,20 @@ def postprocess_html(
         page: The current page.
         post_processor: The post processor to register targets.
         logger: Current plugin logger.
+        elements: The caption elements and images of the page if they were
+            already collected.
+        indices: The next index per identifier. Updated in place to continue
+            the numbering if a page is processed in parts.
     """
     if not config.enable:
         return
-    index = config.start_index
-    for caption_info in iter_caption_elements(TABLE_CAPTION_TAG, tree):
+    indices = {} if indices is None else indices
+    index = indices.get("table", config.start_index)
+    for caption_info in iter_caption_elements(
+        TABLE_CAPTION_TAG,
+        tree,
+        elements=elements,
+    ):
         if caption_info.target_element.tag != "table":
             logger.error(
                 "Table caption must be followed by a table element. Skipping: %s",
@@ -156,13 +175,11 @@ def postprocess_html(
             caption_info=caption_info,
             index=index,
             config=config,
-            logger=logger,
         )
-        if table_id is None:
-            continue
         post_processor.register_target(
             table_id,
             config.get_reference_text(index=index, identifier="table"),
             page,
         )
         index += config.increment_index
+    indices["table"] = index
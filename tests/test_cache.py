@@ -0,0 +1,97 @@
+"""Tests for the cache module."""
+
+import os
+
+from mkdocs_caption.cache import PageCache
+from mkdocs_caption.config import CaptionConfig
+
+
+def _config(**options) -> CaptionConfig:
+    config = CaptionConfig()
+    config.load_dict(options)
+    config.validate()
+    return config
+
+
+def test_cache_roundtrip(tmp_path):
+    cache = PageCache(tmp_path / "cache", 1024 * 1024)
+    key = cache.key("<p>html</p>", _config())
+    assert cache.get(key) is None
+    cache.put(key, "<p>captioned</p>", {"_table-1": "Table 1"})
+    assert cache.get(key) == ("<p>captioned</p>", [("_table-1", "Table 1")])
+    assert cache.reset_stats() == {
+        "hits": 1,
+        "memory_hits": 0,
+        "misses": 1,
+        "writes": 1,
+        "evictions": 0,
+        "size": 0,
+    }
+
+
+def test_cache_key():
+    cache = PageCache(os.devnull, 0)
+    config = _config()
+    key = cache.key("<p>html</p>", config)
+    assert cache.key("<p>html</p>", config) == key
+    assert cache.key("<p>other</p>", config) != key
+    assert cache.key("<p>html</p>", _config(table={"start_index": 2})) != key
+    assert cache.key("<p>html</p>", _config(cache={"max_size": 1})) == key
+    assert cache.key("<p>html</p>", _config(predict_references=True)) == key
+
+
+def test_cache_invalid_entry(tmp_path):
+    cache = PageCache(tmp_path, 1024 * 1024)
+    key = cache.key("<p>html</p>", _config())
+    (tmp_path / f"{key}.json").write_text("{invalid")
+    assert cache.get(key) is None
+
+
+def test_cache_prune(tmp_path):
+    cache = PageCache(tmp_path, 250)
+    keys = [cache.key(f"<p>{index}</p>", _config()) for index in range(3)]
+    for index, key in enumerate(keys):
+        cache.put(key, "x" * 80, {})
+        os.utime(tmp_path / f"{key}.json", (index, index))
+    # The first entry was used last
+    assert cache.get(keys[0]) is not None
+    cache.prune()
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[2]) is not None
+    stats = cache.reset_stats()
+    assert stats["evictions"] == 1
+    assert stats["size"] <= 250
+
+
+def test_cache_memory(tmp_path):
+    memory = {}
+    cache = PageCache(tmp_path, 1024 * 1024, memory=memory)
+    key = cache.key("<p>html</p>", _config())
+    cache.put(key, "<p>captioned</p>", {"_table-1": "Table 1"})
+    (tmp_path / f"{key}.json").unlink()
+    assert cache.get(key) == ("<p>captioned</p>", [("_table-1", "Table 1")])
+    assert cache.reset_stats()["memory_hits"] == 1
+
+
+def test_cache_memory_only():
+    memory = {}
+    cache = PageCache(None, 0, memory=memory)
+    keys = [cache.key(f"<p>{index}</p>", _config()) for index in range(2)]
+    for key in keys:
+        cache.put(key, "<p>captioned</p>", {})
+    cache.prune()
+    # Only the entries used since the last prune are kept
+    assert cache.get(keys[0]) is not None
+    cache.prune()
+    assert list(memory) == [keys[0]]
+    assert cache.reset_stats()["writes"] == 0
+
+
+def test_cache_memory_not_persistent(tmp_path):
+    cache = PageCache(tmp_path, 1024 * 1024, memory={})
+    key = cache.key("# Markdown", _config(), kind="markdown")
+    assert key != cache.key("# Markdown", _config())
+    cache.put(key, "# Wrapped", {}, persistent=False)
+    assert not list(tmp_path.iterdir())
+    assert cache.get(key, persistent=False) == ("# Wrapped", [])
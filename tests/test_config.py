@@ -0,0 +1,39 @@
+"""Tests for the config module."""
+
+import pytest
+
+from mkdocs_caption.config import IdentifierCaption
+
+
+@pytest.mark.parametrize(
+    ("template", "expected"),
+    [
+        ("{Identifier} {index}:", "List 7:"),
+        ("_{identifier}-{index}", "_list-7"),
+        ("{{literal}} {Identifier} {index:03d}", "{literal} List 007"),
+        ("{identifier!r}-{index}", "'list'-7"),
+        ("{Identifier:>6}", "  List"),
+        ("{identifier}{{", "list{"),
+    ],
+)
+def test_format_templates(template, expected):
+    config = IdentifierCaption()
+    config.load_dict({"caption_prefix": template, "reference_text": template})
+    config.validate()
+    assert config.get_caption_prefix(identifier="lIsT", index=7) == expected
+    # The second call uses the cached result
+    assert config.get_reference_text(identifier="lIsT", index=7) == expected
+
+
+def test_format_templates_identifier_braces():
+    config = IdentifierCaption()
+    config.validate()
+    assert config.get_default_id(identifier="{a}", index=1) == "_{a}-1"
+
+
+def test_format_templates_invalid():
+    config = IdentifierCaption()
+    config.load_dict({"default_id": "{unknown}"})
+    config.validate()
+    with pytest.raises(KeyError):
+        config.get_default_id(identifier="table", index=1)
@@ -462,7 +462,7 @@ def test_postprocess_default_reference(dummy_page):
         page=page,
         post_processor=post_processor,
     )
-    assert 'test.html#_list-1"' in post_processor.regex_to_apply
+    assert "_list-1" in post_processor.targets["test.html"]
 
 
 def test_postprocess_ignore_reference_with_text(dummy_page):
@@ -499,7 +499,7 @@ def test_postprocess_custom_reference(dummy_page):
         page=page,
         post_processor=post_processor,
     )
-    assert 'test.html#_list-1"' in post_processor.regex_to_apply
+    assert "_list-1" in post_processor.targets["test.html"]
 
 
 def test_custom_caption_no_target(caplog, dummy_page):
@@ -529,7 +529,6 @@ def test_custom_caption_with_xml(caplog, dummy_page):
     html = p(DEFAULT_CAPTION, DEFAULT_INNER)
     parser = etree.HTMLParser()
     tree = etree.fromstring(html, parser)
-    tree = etree.fromstring(html, parser)
     logger = get_logger("test.md")
     with caplog.at_level("ERROR"):
         custom.postprocess_html(
@@ -539,8 +538,11 @@ def test_custom_caption_with_xml(caplog, dummy_page):
             page=dummy_page,
             post_processor=PostProcessor(),
         )
-    assert "ERROR" in caplog.text
+    assert "ERROR" not in caplog.text
     result = etree.tostring(tree, encoding="unicode", method="html")
     # htmlparser adds <html><body> tags, remove them
     result = result[len("<html><body>") : -len("</body></html>")]
-    assert result == "<p></p><figure></figure><span>Inner</span>"
+    assert result == (
+        '<p></p><figure id="_list-1"><span>Inner</span>'
+        "<figcaption>&lt;not nice&gt; 1: My Caption</figcaption></figure>"
+    )
@@ -0,0 +1,136 @@
+"""Tests for the engine module."""
+
+import pytest
+from lxml import etree
+
+from mkdocs_caption import engine
+from mkdocs_caption.config import CaptionConfig
+from mkdocs_caption.logger import get_logger
+from mkdocs_caption.post_processor import PostProcessor
+
+TABLE = """\
+<p><table-caption identifier="Table" id=table-{index}></p>
+<p>Table caption {index}</p>
+<p><table-caption-end></p>
+<table>
+<tr><td>{index}</td></tr>
+</table>
+"""
+
+FIGURE = """\
+<p><figure-caption identifier="Figure"></p>
+<p>Figure <em>caption</em> {index}</p>
+<p><figure-caption-end></p>
+<p><img alt="alt" src="img-{index}.png" /></p>
+"""
+
+CUSTOM = """\
+<p><custom-caption identifier="List"></p>
+<p>List caption {index}</p>
+<p><custom-caption-end></p>
+<ul>
+<li>Item {index}</li>
+</ul>
+"""
+
+NESTED = """\
+<ul>
+<li>
+<p><table-caption identifier="Table"></p>
+<p>Nested caption {index}</p>
+<p><table-caption-end></p>
+<table><tr><td>nested</td></tr></table>
+</li>
+</ul>
+"""
+
+TEXT = """\
+<p>Text &amp; <a href="#table-{index}"></a> with an image \
+<img alt="Inline {index}" src="inline.png" /> and more text.</p>
+<!-- comment {index} -->
+<pre><code>Table: &lt;code&gt;
+</code></pre>
+"""
+
+
+def _config() -> CaptionConfig:
+    config = CaptionConfig()
+    config.load_dict({"additional_identifier": ["List"]})
+    config.validate()
+    return config
+
+
+def _page_html(count: int) -> str:
+    blocks = (TABLE, FIGURE, CUSTOM, NESTED, TEXT)
+    return "Leading text\n" + "".join(
+        block.format(index=index) for index in range(count) for block in blocks
+    )
+
+
+def _process(name, html, page) -> tuple[str, PostProcessor]:
+    post_processor = PostProcessor()
+    kwargs = {
+        "config": _config(),
+        "page": page,
+        "post_processor": post_processor,
+        "logger": get_logger(page.file.src_path),
+    }
+    if name == "dom":
+        result = engine.postprocess_dom(html, parser=etree.HTMLParser(), **kwargs)
+    else:
+        result = engine.postprocess_stream(html, **kwargs)
+    return result, post_processor
+
+
+def test_select_engine():
+    large = " " * engine.STREAM_THRESHOLD
+    assert engine.select_engine("dom", large) == "dom"
+    assert engine.select_engine("stream", "") == "stream"
+    assert engine.select_engine("auto", "") == "dom"
+    assert engine.select_engine("auto", large) == "stream"
+
+
+@pytest.mark.parametrize("chunk_size", [1, 13, 64 * 1024])
+def test_stream_matches_dom(dummy_page, monkeypatch, chunk_size):
+    monkeypatch.setattr(engine, "STREAM_CHUNK_SIZE", chunk_size)
+    html = _page_html(3)
+    dom_result, dom_post_processor = _process("dom", html, dummy_page)
+    stream_result, stream_post_processor = _process("stream", html, dummy_page)
+    assert stream_result == dom_result
+    assert stream_post_processor.targets.keys() == (dom_post_processor.targets.keys())
+
+
+@pytest.mark.parametrize("chunk_size", [1, 64 * 1024])
+@pytest.mark.parametrize(
+    "html",
+    ["plain text", "<!-- comment -->", "", "\n", "<style>p {}</style>text"],
+)
+def test_stream_matches_dom_without_elements(dummy_page, monkeypatch, chunk_size, html):
+    monkeypatch.setattr(engine, "STREAM_CHUNK_SIZE", chunk_size)
+    dom_result, _ = _process("dom", html, dummy_page)
+    stream_result, _ = _process("stream", html, dummy_page)
+    assert stream_result == dom_result
+
+
+def test_stream_continues_numbering(dummy_page):
+    result, _ = _process("stream", _page_html(2), dummy_page)
+    assert result.startswith("Leading text\n")
+    assert "Table 3: Table caption 1" in result
+    assert "Table 4: Nested caption 1" in result
+    assert "Figure 2: Figure <em>caption</em> 1" in result
+    assert "List 2: List caption 1" in result
+
+
+def test_stream_head_elements(dummy_page):
+    html = '<style>p {}</style><p><img alt="Caption" src="a.png"></p>'
+    result, _ = _process("stream", html, dummy_page)
+    assert result.startswith("<style>p {}</style><p><figure")
+    assert "Figure 1: Caption" in result
+
+
+def test_stream_unterminated_caption(dummy_page):
+    html = '<p><table-caption identifier="Table"></p>\n<p>Caption</p>\n'
+    with pytest.raises(AttributeError):
+        _process("dom", html, dummy_page)
+    with pytest.raises(AttributeError):
+        _process("stream", html, dummy_page)
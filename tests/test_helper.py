@@ -0,0 +1,220 @@
+"""Tests for the helper module."""
+
+import time
+
+import pytest
+from lxml import etree
+
+from mkdocs_caption.helper import (
+    MarkdownCaptionTarget,
+    collect_page_elements,
+    iter_caption_elements,
+    serialize_html_fragment,
+    wrap_md_captions,
+)
+
+TARGETS = {
+    "Table:": MarkdownCaptionTarget(
+        html_tag="table-caption",
+        allow_indented_caption=False,
+    ),
+    "Figure:": MarkdownCaptionTarget(
+        html_tag="figure-caption",
+        allow_indented_caption=True,
+    ),
+    "List:": MarkdownCaptionTarget(
+        html_tag="custom-caption",
+        allow_indented_caption=True,
+    ),
+}
+
+
+def test_wrap_no_targets():
+    markdown = "Table: My Caption\n\nhjkhjk\n"
+    assert wrap_md_captions(markdown, targets={}) == markdown
+
+
+def test_wrap_multiple_identifiers():
+    markdown = """\
+Table: First
+
+hkjbnk
+
+Figure: Second
+
+List: Third
+
+hjkhjk
+"""
+    result = wrap_md_captions(markdown, targets=TARGETS)
+    assert (
+        '<table-caption identifier="Table">\n\nFirst\n\n<table-caption-end>' in result
+    )
+    assert (
+        '<figure-caption identifier="Figure">\n\nSecond\n\n<figure-caption-end>'
+        in result
+    )
+    assert (
+        '<custom-caption identifier="List">\n\nThird\n\n<custom-caption-end>' in result
+    )
+
+
+def test_wrap_indentation_per_identifier():
+    markdown = """\
+    Table: First
+
+    Figure: Second
+
+hjkhjk
+"""
+    result = wrap_md_captions(markdown, targets=TARGETS)
+    assert "table-caption" not in result
+    assert '    <figure-caption identifier="Figure">' in result
+    assert "    Second" in result
+
+
+def test_wrap_identifier_is_no_regex():
+    markdown = """\
+Fig.: First
+
+Fig: Second
+
+hjkhjk
+"""
+    targets = {
+        "Fig.:": MarkdownCaptionTarget(
+            html_tag="figure-caption",
+            allow_indented_caption=True,
+        ),
+    }
+    result = wrap_md_captions(markdown, targets=targets)
+    assert '<figure-caption identifier="Fig.">\n\nFirst' in result
+    assert "Fig: Second" in result
+
+
+def test_wrap_ends_at_first_blank_line():
+    markdown = """\
+Figure: First
+second line {#first}
+
+Figure: Second
+
+hjkhjk
+"""
+    result = wrap_md_captions(markdown, targets=TARGETS)
+    assert (
+        '<figure-caption identifier="Figure"id=first>\n\nFirst second line \n\n'
+        in result
+    )
+    assert "\n\nSecond\n\n" in result
+
+
+def test_wrap_unterminated_caption():
+    markdown = "Figure: First\n\nFigure: Second\nhjkhjk\n"
+    result = wrap_md_captions(markdown, targets=TARGETS)
+    assert "\n\nFirst\n\n" in result
+    assert result.endswith("\nFigure: Second\nhjkhjk\n")
+
+
+# The time budget is very generous. The linear implementation finishes each of
+# these inputs in a few milliseconds while a backtracking implementation takes
+# minutes or longer.
+TIME_BUDGET = 2
+
+
+@pytest.mark.parametrize(
+    "markdown",
+    [
+        pytest.param(
+            "Figure: Caption\n" + "a very long paragraph\n" * 200_000,
+            id="long_paragraph",
+        ),
+        pytest.param(
+            "Figure: Caption {#id\n" * 20_000,
+            id="unterminated_markers",
+        ),
+        pytest.param(
+            "    List: Caption {" * 10_000 + "\n" + "Table: x {\n" * 10_000 + "\n",
+            id="unterminated_options",
+        ),
+        pytest.param(
+            "Table: Caption {" + "#id .class " * 100_000 + "}\n\n" + "text\n",
+            id="huge_options",
+        ),
+        pytest.param(
+            ("Figure: Caption {" + "}" * 1_000 + "\n") * 1_000 + "\n\n",
+            id="many_braces",
+        ),
+        pytest.param(
+            " " * 1_000_000 + "Figure: Caption\n",
+            id="long_indentation",
+        ),
+    ],
+)
+def test_wrap_adversarial_input_is_linear(markdown):
+    start = time.perf_counter()
+    wrap_md_captions(markdown, targets=TARGETS)
+    assert time.perf_counter() - start < TIME_BUDGET
+
+
+CAPTION_TAGS = ("table-caption", "custom-caption", "figure-caption")
+
+
+def test_collect_page_elements():
+    html = (
+        '<p><table-caption identifier="Table"></p>'
+        '<p><img src="a.png"></p>'
+        '<div><img src="b.png"></div>'
+        '<p><span><img src="d.png"></span></p>'
+        '<div><a href="#"><img src="e.png"></a></div>'
+        '<p><custom-caption identifier="List"></p>'
+        '<p><a href="#"><img src="c.png"></a></p>'
+        '<p><custom-caption identifier="Code"></p>'
+    )
+    tree = etree.fromstring(html, etree.HTMLParser())
+    elements = collect_page_elements(tree, caption_tags=CAPTION_TAGS)
+    assert [img.get("src") for img in elements.images] == ["a.png", "c.png"]
+    assert len(elements.captions["table-caption"]) == 1
+    assert [
+        caption.get("identifier") for caption in elements.captions["custom-caption"]
+    ] == ["List", "Code"]
+    assert elements.captions["figure-caption"] == []
+
+
+def test_iter_caption_elements_removes_markers():
+    caption = (
+        '<p><table-caption identifier="Table" id="table-{index}"></p>'
+        "<p>First {index}</p><p>Second {index}</p>"
+        "<p><table-caption-end></p>"
+        "<table></table>"
+    )
+    html = "".join(caption.format(index=index) for index in range(1_000))
+    tree = etree.fromstring(html, etree.HTMLParser())
+    captions = list(iter_caption_elements("table-caption", tree))
+    assert len(captions) == 1_000
+    assert captions[-1].attributes == {"id": "table-999"}
+    assert captions[-1].caption == "First 999 Second 999"
+    assert captions[-1].target_element.tag == "table"
+    body = tree.find("body")
+    assert [element.tag for element in body] == ["table"] * 1_000
+
+
+@pytest.mark.parametrize(
+    "html",
+    [
+        "<p>First</p><table><tr><td>1</td></tr></table>",
+        "Leading text <p>First</p> trailing text",
+        "<p>First</p><!-- comment -->",
+        '<p><img src="a.png"><br></p>',
+    ],
+)
+def test_serialize_html_fragment(html):
+    tree = etree.fromstring(html, etree.HTMLParser())
+    assert serialize_html_fragment(tree) == html
+
+
+def test_serialize_html_fragment_with_head_elements():
+    html = "<style>p {}</style><p>First</p>"
+    tree = etree.fromstring(html, etree.HTMLParser())
+    assert tree[0].tag == "head"
+    assert serialize_html_fragment(tree) == html
@@ -4,6 +4,7 @@ from lxml import etree
 
 from mkdocs_caption import image
 from mkdocs_caption.config import FigureCaption
+from mkdocs_caption.helper import collect_page_elements
 from mkdocs_caption.logger import get_logger
 from mkdocs_caption.post_processor import PostProcessor
 
@@ -520,7 +521,7 @@ def test_postprocess_default_reference(dummy_page):
         page=dummy_page,
         post_processor=post_processor,
     )
-    assert 'test.html#_figure-1"' in post_processor.regex_to_apply
+    assert "_figure-1" in post_processor.targets["test.html"]
 
 
 def test_postprocess_ignore_reference_with_text(dummy_page):
@@ -557,7 +558,7 @@ def test_postprocess_custom_reference(dummy_page):
         page=dummy_page,
         post_processor=post_processor,
     )
-    assert 'test.html#_figure-1"' in post_processor.regex_to_apply
+    assert "_figure-1" in post_processor.targets["test.html"]
 
 
 def test_figure_caption_with_no_img(caplog, dummy_page):
@@ -585,7 +586,7 @@ def test_figure_caption_with_no_img(caplog, dummy_page):
 
 def test_figure_caption_with_xml(caplog, dummy_page):
     config = FigureCaption()
-    img = '<img id="test" src="test.png" title="<hello>This is not nice"'
+    img = '<img id="test" src="test.png" title="&lt;hello&gt;This is not nice">'
     html = p(img)
     parser = etree.HTMLParser()
     tree = etree.fromstring(html, parser)
@@ -598,11 +599,9 @@ def test_figure_caption_with_xml(caplog, dummy_page):
             page=dummy_page,
             post_processor=PostProcessor(),
         )
-    assert "ERROR" in caplog.text
+    assert "ERROR" not in caplog.text
     result = etree.tostring(tree, encoding="unicode", method="html")
-    # htmlparser adds <html><body> tags, remove them
-    result = result[len("<html><body>") : -len("</body></html>")]
-    assert result == '<p><img id="test" src="test.png"></p>'
+    assert "<figcaption>Figure 1: &lt;hello&gt;This is not nice</figcaption>" in result
 
 
 def test_figure_caption_ignores_inline(dummy_page):
@@ -794,3 +793,36 @@ def test_figure_caption_ignore_siblings(dummy_page):
     assert len(result_imgs) == 2
     assert result_imgs[0].get("src") == "test_dark.png#dark-only"
     assert result_imgs[1].tag == "figcaption"
+
+
+def test_postprocess_collected_elements(dummy_page):
+    config = FigureCaption()
+    caption = (
+        '<p><figure-caption identifier="Figure"></p>'
+        '<p>Caption <img src="inline.png" alt="Inline"></p>'
+        "<p><figure-caption-end></p>"
+    )
+    html = p(caption, p(DEFAULT_IMG), p('<img src="other.png" alt="Other">'))
+    results = []
+    for collect in (False, True):
+        tree = etree.fromstring(html, etree.HTMLParser())
+        elements = (
+            collect_page_elements(tree, caption_tags=(image.IMG_CAPTION_TAG,))
+            if collect
+            else None
+        )
+        image.postprocess_html(
+            tree=tree,
+            config=config,
+            logger=get_logger("test.md"),
+            page=dummy_page,
+            post_processor=PostProcessor(),
+            elements=elements,
+        )
+        results.append(etree.tostring(tree, encoding="unicode", method="html"))
+    assert results[0] == results[1]
+    assert (
+        '<figcaption>Figure 1: Caption <img src="inline.png" alt="Inline"></figcaption>'
+        in results[1]
+    )
+    assert "<figcaption>Figure 2: Other</figcaption>" in results[1]
@@ -6,6 +6,10 @@ from unittest.mock import MagicMock
 
 from mkdocs import config
 from mkdocs.commands import build
+from mkdocs.structure.files import File, Files
+from mkdocs.structure.pages import Page
+
+from mkdocs_caption.plugin import CaptionPlugin
 
 
 def test_demo(caplog):
@@ -20,6 +24,367 @@ def test_demo(caplog):
         assert caplog.text == ""
 
 
+def _load_plugin(**options) -> CaptionPlugin:
+    demo_config_file = Path(__file__).parents[1] / "demo" / "mkdocs.yml"
+    cfg = config.load_config(config_file=str(demo_config_file.absolute()))
+    plugin = cfg["plugins"]["caption"]
+    plugin.on_startup(command="build", dirty=False)
+    for key, value in options.items():
+        if isinstance(value, dict):
+            plugin.config[key].update(value)
+        else:
+            plugin.config[key] = value
+    plugin.on_config(cfg)
+    return plugin
+
+
+def _rebuild() -> CaptionPlugin:
+    """Load the configuration again like a rebuild of `mkdocs serve`."""
+    demo_config_file = Path(__file__).parents[1] / "demo" / "mkdocs.yml"
+    cfg = config.load_config(config_file=str(demo_config_file.absolute()))
+    plugin = cfg["plugins"]["caption"]
+    plugin.on_config(cfg)
+    return plugin
+
+
+def test_page_content_fast_path(dummy_page):
+    plugin = _load_plugin()
+    html = "<h1>Title</h1><p>Nothing to caption here</p>"
+    assert plugin.on_page_content(html, page=dummy_page) is html
+    assert plugin.stats == {"pages": 1, "fast_path_pages": 1}
+
+
+def test_page_content_no_fast_path_for_uppercase_tags(dummy_page):
+    plugin = _load_plugin()
+    html = '<p><IMG SRC="test.png" ALT="Upper"></p>'
+    result = plugin.on_page_content(html, page=dummy_page)
+    assert "<figcaption>Figure 1: Upper</figcaption>" in result
+
+
+def test_page_content_no_fast_path_for_images(dummy_page):
+    plugin = _load_plugin()
+    html = '<p><img src="test.png" alt="Caption"></p>'
+    result = plugin.on_page_content(html, page=dummy_page)
+    assert "<figcaption>Figure 1: Caption</figcaption>" in result
+    assert plugin.stats == {"pages": 1}
+
+
+def test_page_content_fast_path_disabled_stage(dummy_page):
+    plugin = _load_plugin()
+    plugin.config.figure.enable = False
+    html = '<p><img src="test.png" alt="Caption"></p>'
+    assert plugin.on_page_content(html, page=dummy_page) is html
+    assert plugin.stats == {"pages": 1, "fast_path_pages": 1}
+
+
+def test_page_content_stream_engine(dummy_page):
+    plugin = _load_plugin()
+    plugin.config.engine = "stream"
+    html = '<p><img src="test.png" alt="Caption"></p>'
+    result = plugin.on_page_content(html, page=dummy_page)
+    assert "<figcaption>Figure 1: Caption</figcaption>" in result
+    assert plugin.stats == {"pages": 1, "stream_pages": 1}
+
+
+def test_rebuilds_release_targets(dummy_page):
+    plugin = _load_plugin()
+    html = (
+        '<p><table-caption identifier="Table"></p><p>Caption</p>'
+        '<p><table-caption-end></p><table></table><p><a href="#_table-1"></a></p>'
+    )
+    plugin.on_startup(command="serve", dirty=False)
+    for _ in range(20):
+        # Every rebuild of `mkdocs serve` loads the configuration again
+        assert _rebuild() is plugin
+        dummy_page.content = plugin.on_page_content(html, page=dummy_page)
+        assert plugin.registry_stats["targets"] == 1
+        plugin.on_page_context({}, page=dummy_page)
+        assert dummy_page.content.endswith('<a href="#_table-1">Table 1</a></p>')
+        plugin.on_post_build()
+    assert plugin.registry_stats == {
+        "pages": 0,
+        "targets": 0,
+        "resolved_references": 0,
+        "skipped_pages": 0,
+        "filled_references": 0,
+        "corrected_references": 0,
+        "predicted_pages": 0,
+        "dependencies": 0,
+        "generation": 20,
+    }
+    plugin.on_shutdown()
+
+
+def test_dependencies_across_rebuilds(dummy_page):
+    plugin = _load_plugin()
+    other = Page("Other", File("other.md", "", "", use_directory_urls=False), {})
+    pages = [
+        (
+            other,
+            (
+                '<p><table-caption identifier="Table"></p><p>Caption</p>'
+                "<p><table-caption-end></p><table></table>"
+            ),
+        ),
+        (dummy_page, '<p><a href="other.html#_table-1"></a></p>'),
+    ]
+    for generation in (1, 2):
+        for page, html in pages:
+            page.content = plugin.on_page_content(html, page=page)
+        for page, _ in pages:
+            plugin.on_page_context({}, page=page)
+        assert dummy_page.content.endswith(">Other/Table 1</a></p>")
+        plugin.on_post_build()
+        assert plugin.post_processor.referencing_pages(other) == {"test.html"}
+        assert plugin.registry_stats["generation"] == generation
+        # The plugin and its post-processor are kept across the rebuild
+        assert _rebuild() is plugin
+    assert plugin.post_processor.referencing_pages(other) == {"test.html"}
+
+
+def test_page_context_skips_pages_without_references(dummy_page):
+    plugin = _load_plugin()
+    html = '<p><img src="test.png" alt="Caption"><a href="#other"></a></p>'
+    dummy_page.content = content = plugin.on_page_content(html, page=dummy_page)
+    plugin.on_page_context({}, page=dummy_page)
+    assert dummy_page.content is content
+    assert plugin.registry_stats["skipped_pages"] == 1
+
+
+def test_dependencies_of_removed_pages(dummy_page):
+    plugin = _load_plugin()
+    other = Page("Other", File("other.md", "", "", use_directory_urls=False), {})
+    third = Page("Third", File("third.md", "", "", use_directory_urls=False), {})
+    table = (
+        '<p><table-caption identifier="Table"></p><p>Caption</p>'
+        "<p><table-caption-end></p><table></table>"
+    )
+    reference = '<p><a href="other.html#_table-1"></a></p>'
+    pages = [(other, table), (dummy_page, reference), (third, reference)]
+    for page, html in pages:
+        page.content = plugin.on_page_content(html, page=page)
+    for page, _ in pages:
+        plugin.on_page_context({}, page=page)
+    plugin.on_post_build()
+    assert plugin.post_processor.referencing_pages(other) == {"test.html", "third.html"}
+    # The third page is removed and the references on the test page are deleted
+    _rebuild().on_files(Files([other.file, dummy_page.file]), config=MagicMock())
+    assert plugin.post_processor.referencing_pages(other) == {"test.html"}
+    assert plugin.post_processor.referenced_pages(third) == set()
+    dummy_page.content = plugin.on_page_content("", page=dummy_page)
+    plugin.on_page_context({}, page=dummy_page)
+    plugin.on_post_build()
+    assert plugin.post_processor.referencing_pages(other) == set()
+
+
+def _other_file(tmp_path) -> File:
+    (tmp_path / "other.md").write_text("# Other\n\nTable: Caption\n\n| a |\n|---|\n")
+    return File("other.md", str(tmp_path), str(tmp_path), use_directory_urls=False)
+
+
+def test_files_predict_targets(dummy_page, tmp_path):
+    plugin = _load_plugin(predict_references=True)
+    plugin.on_files(Files([_other_file(tmp_path)]), config=MagicMock())
+    html = '<p><img src="test.png" alt="Caption"><a href="other.html#_table-1"></a></p>'
+    dummy_page.content = plugin.on_page_content(html, page=dummy_page)
+    assert '<a href="other.html#_table-1">Other/Table 1</a>' in dummy_page.content
+    plugin.on_page_context({}, page=dummy_page)
+    assert '<a href="other.html#_table-1"></a>' in dummy_page.content
+    assert plugin.registry_stats["corrected_references"] == 1
+    assert plugin.registry_stats["predicted_pages"] == 1
+
+
+def test_files_predict_only_referenced_pages(dummy_page, tmp_path):
+    plugin = _load_plugin(predict_references=True)
+    plugin.on_files(Files([_other_file(tmp_path)]), config=MagicMock())
+    html = '<p><img src="test.png" alt="Caption"><a href="#_figure-1"></a></p>'
+    plugin.on_page_content(html, page=dummy_page)
+    assert plugin.registry_stats["predicted_pages"] == 0
+
+
+def test_files_predict_targets_opt_in(dummy_page, tmp_path):
+    plugin = _load_plugin()
+    plugin.on_files(Files([_other_file(tmp_path)]), config=MagicMock())
+    html = '<p><img src="test.png" alt="Caption"><a href="other.html#_table-1"></a></p>'
+    assert '<a href="other.html#_table-1"></a>' in plugin.on_page_content(
+        html,
+        page=dummy_page,
+    )
+    assert plugin.registry_stats["predicted_pages"] == 0
+
+
+def test_files_predict_prefetched_targets(dummy_page, tmp_path):
+    plugin = _load_plugin(predict_references=True, preprocess_workers=1)
+    other = _other_file(tmp_path)
+    plugin.on_files(Files([other]), config=MagicMock())
+    # The prediction reuses the prefetched markdown instead of the file
+    Path(other.abs_src_path).unlink()
+    html = '<p><img src="test.png" alt="Caption"><a href="other.html#_table-1"></a></p>'
+    assert '<a href="other.html#_table-1">Other/Table 1</a>' in plugin.on_page_content(
+        html,
+        page=dummy_page,
+    )
+
+
+def test_files_predict_reuses_wrapped_markdown(dummy_page, tmp_path):
+    plugin = _load_plugin(predict_references=True)
+    other = _other_file(tmp_path)
+    plugin.on_files(Files([other]), config=MagicMock())
+    html = '<p><img src="test.png" alt="Caption"><a href="other.html#_table-1"></a></p>'
+    plugin.on_page_content(html, page=dummy_page)
+    # The markdown wrapped for the prediction is not wrapped again
+    page = Page("Other", other, {})
+    markdown = other.content_string
+    assert "<table-caption" in plugin.on_page_markdown(markdown, page=page)
+    assert plugin.stats["prefetched_pages"] == 1
+
+
+def test_files_predict_targets_with_cache(dummy_page, tmp_path):
+    html = '<p><img src="test.png" alt="Caption"><a href="other.html#_table-1"></a></p>'
+    cache = {"enable": True, "directory": str(tmp_path / "cache")}
+    for cached in (False, True):
+        plugin = _load_plugin(predict_references=True, cache=cache)
+        plugin.on_files(Files([_other_file(tmp_path)]), config=MagicMock())
+        content = plugin.on_page_content(html, page=dummy_page)
+        assert '<a href="other.html#_table-1">Other/Table 1</a>' in content
+        assert ("cached_pages" in plugin.stats) is cached
+        plugin.on_post_build()
+
+
+def test_files_prefetch_markdown(dummy_page, tmp_path):
+    (tmp_path / "test.md").write_text("# Title\n\nTable: Caption\n\n| a |\n|---|\n")
+    file = File("test.md", str(tmp_path), str(tmp_path), use_directory_urls=False)
+    markdown = file.content_string
+    expected = _load_plugin().on_page_markdown(markdown, page=dummy_page)
+    plugin = _load_plugin(preprocess_workers=1)
+    plugin.on_files(Files([file]), config=MagicMock())
+    assert plugin.on_page_markdown(markdown, page=dummy_page) == expected
+    assert plugin.stats == {"prefetched_pages": 1}
+    # The markdown was changed by another plugin or is rendered again
+    plugin.on_files(Files([file]), config=MagicMock())
+    changed = f"{markdown}\nTable: Other\n\n| b |\n|---|\n"
+    assert "Table: Other" not in plugin.on_page_markdown(changed, page=dummy_page)
+    assert plugin.on_page_markdown(markdown, page=dummy_page) == expected
+    assert plugin.stats == {"prefetched_pages": 1}
+
+
+def test_page_config_does_not_change_global_config(dummy_page):
+    plugin = _load_plugin()
+    html = '<p><img src="test.png" alt="Caption"></p>'
+    for _ in range(2):
+        dummy_page.meta = {"caption": {"figure": {"start_index": 5}}}
+        assert "Figure 5: Caption" in plugin.on_page_content(html, page=dummy_page)
+    assert plugin.config.figure.start_index == 1
+    dummy_page.meta = {}
+    assert "Figure 1: Caption" in plugin.on_page_content(html, page=dummy_page)
+
+
+def test_page_content_cache(dummy_page, tmp_path):
+    html = (
+        '<p><img src="test.png" alt="Caption"></p>'
+        '<p><a href="#_figure-1"></a><a href="other.html#x"></a></p>'
+    )
+    results = []
+    for _ in range(2):
+        plugin = _load_plugin(cache={"enable": True, "directory": str(tmp_path)})
+        dummy_page.content = plugin.on_page_content(html, page=dummy_page)
+        plugin.on_page_context({}, page=dummy_page)
+        results.append((dummy_page.content, plugin.stats))
+        plugin.on_post_build()
+    assert results[0][0] == results[1][0]
+    assert '<a href="#_figure-1">Figure 1</a>' in results[1][0]
+    assert results[0][1] == {"pages": 1}
+    assert results[1][1] == {"pages": 1, "cached_pages": 1}
+
+
+def test_page_content_cache_skips_pages_with_errors(dummy_page, tmp_path, caplog):
+    html = (
+        '<p><table-caption identifier="Table"></p><p>Caption</p>'
+        "<p><table-caption-end></p><p>No table</p>"
+    )
+    for _ in range(2):
+        plugin = _load_plugin(cache={"enable": True, "directory": str(tmp_path)})
+        caplog.clear()
+        plugin.on_page_content(html, page=dummy_page)
+        assert "must be followed by a table" in caplog.text
+        assert "cached_pages" not in plugin.stats
+        plugin.on_post_build()
+    # Nor are they kept in memory by `mkdocs serve`
+    plugin.on_startup(command="serve", dirty=False)
+    for _ in range(2):
+        assert _rebuild() is plugin
+        caplog.clear()
+        plugin.on_page_content(html, page=dummy_page)
+        assert "must be followed by a table" in caplog.text
+        assert "cached_pages" not in plugin.stats
+        plugin.on_post_build()
+    plugin.on_shutdown()
+
+
+def test_serve_keeps_pages_in_memory(dummy_page):
+    plugin = _load_plugin()
+    mkdocs_config = MagicMock(plugins={"caption": plugin}, config_file_path=None)
+    plugin.on_startup(command="serve", dirty=False)
+    markdown = "Table: Caption\n\n| a |\n|---|\n"
+    html = '<p><img src="test.png" alt="Caption"><a href="#_figure-1"></a></p>'
+    results = []
+    for _ in range(2):
+        plugin.on_config(mkdocs_config)
+        source = plugin.on_page_markdown(markdown, page=dummy_page)
+        dummy_page.content = plugin.on_page_content(html, page=dummy_page)
+        plugin.on_page_context({}, page=dummy_page)
+        results.append((source, dummy_page.content, plugin.stats))
+        plugin.on_post_build()
+    assert results[0][:2] == results[1][:2]
+    assert '<a href="#_figure-1">Figure 1</a>' in results[1][1]
+    assert results[1][2] == {"pages": 1, "cached_pages": 1}
+    plugin.on_shutdown()
+    plugin.on_config(mkdocs_config)
+    plugin.on_page_content(html, page=dummy_page)
+    assert plugin.stats == {"pages": 1}
+
+
+def test_build_does_not_keep_pages_in_memory(dummy_page):
+    plugin = _load_plugin()
+    plugin.on_startup(command="build", dirty=False)
+    plugin.on_config(MagicMock(plugins={"caption": plugin}))
+    html = '<p><img src="test.png" alt="Caption"></p>'
+    plugin.on_page_content(html, page=dummy_page)
+    plugin.on_post_build()
+    plugin.on_page_content(html, page=dummy_page)
+    assert "cached_pages" not in plugin.stats
+
+
+REFERENCES_HTML = (
+    '<p><img src="test.png" alt="Caption"><a href="#_figure-1"></a>'
+    '<a href="other.html#_table-1"></a></p>'
+)
+
+
+def test_cross_references_local(dummy_page, tmp_path):
+    plugin = _load_plugin(cross_references="local")
+    (tmp_path / "other.md").write_text("Table: Caption\n\n| a |\n|---|\n")
+    other = File("other.md", str(tmp_path), str(tmp_path), use_directory_urls=False)
+    plugin.on_files(Files([other]), config=MagicMock())
+    dummy_page.content = plugin.on_page_content(REFERENCES_HTML, page=dummy_page)
+    assert dummy_page.content.endswith(
+        '<a href="#_figure-1">Figure 1</a><a href="other.html#_table-1"></a></p>',
+    )
+    # The targets of the page are released once it was captioned.
+    assert plugin.registry_stats["pages"] == 0
+    content = dummy_page.content
+    plugin.on_page_context({}, page=dummy_page)
+    assert dummy_page.content is content
+
+
+def test_cross_references_off(dummy_page):
+    plugin = _load_plugin(cross_references="off")
+    result = plugin.on_page_content(REFERENCES_HTML, page=dummy_page)
+    assert "<figcaption>Figure 1: Caption</figcaption>" in result
+    assert result.endswith(REFERENCES_HTML[REFERENCES_HTML.index("<a") :])
+    assert plugin.registry_stats["targets"] == 0
+
+
 if __name__ == "__main__":
     log = MagicMock()
     test_demo(log)
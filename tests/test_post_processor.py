@@ -1,13 +1,27 @@
 """Tests for the post processor."""
 
+from lxml import etree
+from mkdocs.structure.files import File
+from mkdocs.structure.pages import Page
+
 from mkdocs_caption.post_processor import PostProcessor
 
 
 def test_post_processor_register(dummy_page):
     post_processor = PostProcessor()
     post_processor.register_target("identifier", "text", dummy_page)
-    assert 'test.html#identifier"' in post_processor.regex_to_apply
-    assert dummy_page.file.src_uri in post_processor._local_regex  # noqa: SLF001
+    assert "identifier" in post_processor.targets["test.html"]
+    assert post_processor.stats == {
+        "pages": 1,
+        "targets": 1,
+        "resolved_references": 0,
+        "skipped_pages": 0,
+        "filled_references": 0,
+        "corrected_references": 0,
+        "predicted_pages": 0,
+        "dependencies": 0,
+        "generation": 0,
+    }
 
 
 def test_post_processor_replace_ok(dummy_page):
@@ -59,3 +73,290 @@ def test_post_processor_similar_tag(dummy_page):
     assert (
         post_processor.post_process(dummy_page, content) == '<a href="#test2">right</a>'
     )
+
+
+def test_post_processor_relative_path(dummy_page):
+    post_processor = PostProcessor("{page_title} {local_ref}")
+    post_processor.register_target("identifier", "text", dummy_page)
+    content = (
+        '<a class="ref" href="../test.html#identifier" title="x"></a>'
+        '<a href="../othertest.html#identifier"></a>'
+        '<a href="test.html#identifier">keep</a>'
+    )
+    assert post_processor.post_process(dummy_page, content) == (
+        '<a class="ref" href="../test.html#identifier" title="x">Test text</a>'
+        '<a href="../othertest.html#identifier"></a>'
+        '<a href="test.html#identifier">keep</a>'
+    )
+
+
+def test_post_processor_replacement_is_literal(dummy_page):
+    post_processor = PostProcessor()
+    post_processor.register_target("identifier", r"Table 1: \1 \g<0>", dummy_page)
+    content = '<a href="test.html#identifier"></a>'
+    assert (
+        post_processor.post_process(dummy_page, content)
+        == r'<a href="test.html#identifier">Table 1: \1 \g<0></a>'
+    )
+
+
+def test_post_processor_local_references(dummy_page):
+    post_processor = PostProcessor("{page_title} {local_ref}")
+    for index in range(2_000):
+        post_processor.register_target(f"table-{index}", f"Table {index}", dummy_page)
+    content = "".join(
+        f'<a href="#table-{index}"></a><a href="#table-{index}">keep</a>'
+        for index in range(0, 2_000, 100)
+    )
+    result = post_processor.post_process(dummy_page, content)
+    assert result.count("keep") == 20
+    assert '<a href="#table-1900">Table 1900</a>' in result
+    assert '<a href="#table-100">Table 100</a>' in result
+
+
+def test_post_processor_stats(dummy_page):
+    post_processor = PostProcessor("{page_title} {local_ref}")
+    post_processor.register_target("first", "First", dummy_page)
+    post_processor.register_target("second", "Second", dummy_page)
+    content = '<a href="#first"></a><a href="test.html#second"></a><a href="#x"></a>'
+    assert post_processor.post_process(dummy_page, content) == (
+        '<a href="#first">First</a><a href="test.html#second">Test Second</a>'
+        '<a href="#x"></a>'
+    )
+    assert post_processor.stats == {
+        "pages": 1,
+        "targets": 2,
+        "resolved_references": 2,
+        "skipped_pages": 0,
+        "filled_references": 0,
+        "corrected_references": 0,
+        "predicted_pages": 0,
+        "dependencies": 0,
+        "generation": 0,
+    }
+
+
+def test_post_processor_interns_identifiers(dummy_page):
+    other_page = Page(
+        title="Other",
+        file=File(path="other.md", src_dir="", dest_dir="", use_directory_urls=False),
+        config={},
+    )
+    post_processor = PostProcessor()
+    for number, page in ((1, dummy_page), (1, other_page)):
+        post_processor.register_target(f"_table-{number}", "Table 1", page)
+    first, second = (next(iter(texts)) for texts in post_processor.targets.values())
+    assert first is second
+
+
+def test_post_processor_clear(dummy_page):
+    post_processor = PostProcessor()
+    post_processor.register_target("identifier", "text", dummy_page)
+    post_processor.clear()
+    content = '<a href="#identifier"></a>'
+    assert post_processor.post_process(dummy_page, content) == content
+    assert post_processor.stats == {
+        "pages": 0,
+        "targets": 0,
+        "resolved_references": 0,
+        "skipped_pages": 0,
+        "filled_references": 0,
+        "corrected_references": 0,
+        "predicted_pages": 0,
+        "dependencies": 0,
+        "generation": 1,
+    }
+
+
+def test_post_processor_collected_references(dummy_page):
+    post_processor = PostProcessor()
+    post_processor.register_target("first", "First", dummy_page)
+    post_processor.register_target("second", "Second", dummy_page)
+    post_processor.collect_references(dummy_page, '<a href="#first"></a>')
+    content = '<a href="#first"></a><a href="#second"></a>'
+    assert (
+        post_processor.post_process(dummy_page, content)
+        == '<a href="#first">First</a><a href="#second"></a>'
+    )
+    # The references are only used once
+    assert (
+        post_processor.post_process(dummy_page, content)
+        == '<a href="#first">First</a><a href="#second">Second</a>'
+    )
+
+
+def _anchors(content: str) -> list:
+    return list(etree.fromstring(content, etree.HTMLParser()).iter("a"))
+
+
+def _other_page() -> Page:
+    return Page(
+        title="Other",
+        file=File(path="other.md", src_dir="", dest_dir="", use_directory_urls=False),
+        config={},
+    )
+
+
+def test_post_processor_fill_references(dummy_page):
+    post_processor = PostProcessor()
+    post_processor.register_target("first", "First", dummy_page)
+    post_processor.register_target("markup", "<em>Markup</em>", dummy_page)
+    anchors = _anchors(
+        '<a href="#first"></a><a href="#first">Text</a><a href="#markup"></a>'
+        '<a href="#unknown"></a><a href="other.html#first"></a>',
+    )
+    post_processor.fill_references(dummy_page, anchors)
+    assert [anchor.text for anchor in anchors] == ["First", "Text", None, None, None]
+    assert post_processor.stats["filled_references"] == 1
+
+
+def test_post_processor_dependencies(dummy_page):
+    other_page = _other_page()
+    post_processor = PostProcessor()
+    post_processor.register_target("first", "First", other_page)
+    post_processor.register_target("second", "Second", dummy_page)
+    post_processor.register_target("own", "Own", dummy_page)
+    # Filled while the page is rendered
+    anchors = _anchors('<a href="test.html#second"></a>')
+    post_processor.fill_references(other_page, anchors)
+    post_processor.post_process(other_page, "")
+    # Resolved when the page is post-processed
+    post_processor.post_process(
+        dummy_page,
+        '<a href="other.html#first"></a><a href="#own"></a>'
+        '<a href="missing.html#first"></a>',
+    )
+    assert post_processor.referencing_pages(other_page) == {"test.html"}
+    assert post_processor.referencing_pages(dummy_page) == {"other.html"}
+    assert post_processor.referenced_pages(dummy_page) == {"other.html"}
+    assert post_processor.stats["dependencies"] == 2
+    # The dependencies are kept for the next build and replaced once the page
+    # is post-processed again.
+    post_processor.clear()
+    assert post_processor.referencing_pages(other_page) == {"test.html"}
+    post_processor.post_process(dummy_page, '<a href="other.html#first"></a>')
+    assert post_processor.referencing_pages(other_page) == set()
+    assert post_processor.referenced_pages(dummy_page) == set()
+    assert post_processor.referencing_pages(dummy_page) == {"other.html"}
+
+
+def test_post_processor_fill_predicted_references(dummy_page):
+    other_page = _other_page()
+    post_processor = PostProcessor("{page_title}: {local_ref}")
+    post_processor.predict_targets(
+        other_page.file,
+        "Other",
+        {"first": "First", "second": "Second", "third": "Third"},
+    )
+    content = (
+        '<p><a href="other.html#first"></a><a href="other.html#second"></a>'
+        '<a href="other.html#third"></a></p>'
+    )
+    anchors = _anchors(content)
+    post_processor.fill_references(dummy_page, anchors)
+    content = "".join(
+        etree.tostring(anchor, encoding="unicode", method="html") for anchor in anchors
+    )
+    post_processor.collect_references(dummy_page, content)
+    assert content == (
+        '<a href="other.html#first">Other: First</a>'
+        '<a href="other.html#second">Other: Second</a>'
+        '<a href="other.html#third">Other: Third</a>'
+    )
+    # The prediction of the second target was wrong, the third does not exist.
+    post_processor.register_target("first", "First", other_page)
+    post_processor.register_target("second", "Fourth", other_page)
+    assert post_processor.post_process(dummy_page, content) == (
+        '<a href="other.html#first">Other: First</a>'
+        '<a href="other.html#second">Other: Fourth</a>'
+        '<a href="other.html#third"></a>'
+    )
+    assert post_processor.stats["filled_references"] == 3
+    assert post_processor.stats["corrected_references"] == 2
+
+
+def test_post_processor_predict_expected_pages(dummy_page):
+    other_page = _other_page()
+    third_page = Page(
+        title="Third",
+        file=File(path="third.md", src_dir="", dest_dir="", use_directory_urls=False),
+        config={},
+    )
+    predicted = []
+
+    def predict(file: File) -> tuple:
+        predicted.append(file.src_path)
+        return "Predicted", {"first": "First"}
+
+    post_processor = PostProcessor("{page_title}: {local_ref}")
+    post_processor.expect_pages([other_page.file, third_page.file], predict=predict)
+    post_processor.register_target("second", "Second", third_page)
+    anchors = _anchors(
+        '<p><a href="../other.html#first"></a><a href="other.html#second"></a>'
+        '<a href="third.html#first"></a><a href="#first"></a></p>',
+    )
+    post_processor.fill_references(dummy_page, anchors)
+    assert [anchor.text for anchor in anchors] == ["Predicted: First", None, None, None]
+    # Rendered pages are not predicted and every page only once.
+    assert predicted == ["other.md"]
+    assert post_processor.stats["predicted_pages"] == 1
+
+
+def test_post_processor_predict_error(dummy_page):
+    def predict(_file: File) -> tuple:
+        raise KeyError
+
+    post_processor = PostProcessor()
+    post_processor.expect_pages([_other_page().file], predict=predict)
+    anchors = _anchors('<a href="other.html#first"></a><a href="#first"></a>')
+    post_processor.register_target("first", "First", dummy_page)
+    post_processor.fill_references(dummy_page, anchors)
+    assert [anchor.text for anchor in anchors] == [None, "First"]
+    assert post_processor.stats["predicted_pages"] == 1
+
+
+def test_post_processor_fill_content(dummy_page):
+    post_processor = PostProcessor("{page_title}: {local_ref}")
+    post_processor.register_target("first", "First", dummy_page)
+    post_processor.predict_targets(_other_page().file, "Other", {"second": "Second"})
+    content = (
+        '<a href="#first"></a><a href="other.html#second"></a>'
+        '<a href="#missing"></a><a href="#first">Text</a>'
+    )
+    assert post_processor.fill_content(dummy_page, content) == (
+        '<a href="#first">First</a><a href="other.html#second">Other: Second</a>'
+        '<a href="#missing"></a><a href="#first">Text</a>'
+    )
+    assert post_processor.stats["filled_references"] == 2
+
+
+def test_post_processor_correct_only_filled_references(dummy_page):
+    post_processor = PostProcessor()
+    post_processor.predict_targets(dummy_page.file, "Test", {"first": "First"})
+    post_processor.fill_references(dummy_page, _anchors('<a href="#first"></a>'))
+    content = '<a href="#first">First</a><a href="#first">Other</a>'
+    post_processor.collect_references(dummy_page, content)
+    assert post_processor.post_process(dummy_page, content) == (
+        '<a href="#first"></a><a href="#first">Other</a>'
+    )
+
+
+def test_post_processor_scope_local(dummy_page):
+    post_processor = PostProcessor(scope="local")
+    post_processor.predict_targets(dummy_page.file, "Test", {"first": "First"})
+    post_processor.register_target("first", "First", dummy_page)
+    content = '<a href="#first"></a><a href="test.html#first"></a>'
+    assert (
+        post_processor.post_process(dummy_page, content)
+        == '<a href="#first">First</a><a href="test.html#first"></a>'
+    )
+    assert post_processor.targets == {}
+
+
+def test_post_processor_scope_off(dummy_page):
+    post_processor = PostProcessor(scope="off")
+    post_processor.register_target("first", "First", dummy_page)
+    anchors = _anchors('<a href="#first"></a>')
+    post_processor.fill_references(dummy_page, anchors)
+    assert anchors[0].text is None
+    assert post_processor.targets == {}
@@ -0,0 +1,55 @@
+"""Tests for the prefetch module."""
+
+import pytest
+from mkdocs.structure.files import File
+
+from mkdocs_caption import prefetch, table
+from mkdocs_caption.config import CaptionConfig
+from mkdocs_caption.helper import wrap_md_captions
+
+SOURCE = "# Title\n\nTable: Caption\n\n| a |\n|---|\n"
+
+
+def _targets() -> dict:
+    config = CaptionConfig()
+    config.validate()
+    return table.get_markdown_targets(config=config.table)
+
+
+def _file(tmp_path, name: str, content: str) -> File:
+    (tmp_path / name).write_text(content, encoding="utf-8")
+    return File(name, str(tmp_path), str(tmp_path / "site"), use_directory_urls=False)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_prefetch_markdown(tmp_path, workers):
+    targets = _targets()
+    files = [
+        _file(tmp_path, "first.md", f"---\ntitle: First\n---\n{SOURCE}"),
+        _file(tmp_path, "second.md", SOURCE),
+        _file(
+            tmp_path,
+            "own.md",
+            f"---\ncaption:\n  table:\n    enable: false\n---\n{SOURCE}",
+        ),
+    ]
+    files.append(File("missing.md", str(tmp_path), "", use_directory_urls=False))
+    prefetched = prefetch.prefetch_markdown(files, targets=targets, workers=workers)
+    wrapped = wrap_md_captions(SOURCE, targets=targets)
+    assert wrapped != SOURCE
+    assert prefetched == {
+        "first.md": (prefetch.digest(SOURCE), wrapped, "First"),
+        "second.md": (prefetch.digest(SOURCE), wrapped, "Title"),
+    }
+
+
+def test_preprocess_source():
+    targets = _targets()
+    wrapped = wrap_md_captions(SOURCE, targets=targets)
+    assert prefetch.preprocess_source(SOURCE, targets=targets) == (
+        prefetch.digest(SOURCE),
+        wrapped,
+        "Title",
+    )
+    source = f"---\ncaption:\n  table:\n    enable: false\n---\n{SOURCE}"
+    assert prefetch.preprocess_source(source, targets=targets) is None
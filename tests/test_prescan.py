@@ -0,0 +1,111 @@
+"""Tests for the prescan module."""
+
+from mkdocs.structure.files import File
+from mkdocs.utils import meta
+
+from mkdocs_caption import custom, image, prescan, table
+from mkdocs_caption.config import CaptionConfig
+from mkdocs_caption.helper import wrap_md_captions
+
+SOURCE = """\
+# Page title
+
+Table: First
+
+| a |
+|---|
+
+```
+Table: In a code block
+```
+
+Table: Second {#second}
+
+| b |
+|---|
+
+![Figure](figure.png "Not predicted")
+
+List: A list
+
+- Item
+"""
+
+
+def _config() -> CaptionConfig:
+    config = CaptionConfig()
+    config.load_dict({"additional_identifier": ["List"]})
+    config.validate()
+    return config
+
+
+def _targets(config: CaptionConfig) -> dict:
+    return {
+        **custom.get_markdown_targets(
+            config=config.custom,
+            identifiers=config.additional_identifier,
+        ),
+        **image.get_markdown_targets(config=config.figure),
+        **table.get_markdown_targets(config=config.table),
+    }
+
+
+def _file(tmp_path, name: str, content: str) -> File:
+    (tmp_path / name).write_text(content, encoding="utf-8")
+    return File(name, str(tmp_path), str(tmp_path / "site"), use_directory_urls=False)
+
+
+def test_scan_markdown():
+    config = _config()
+    texts = prescan.scan_markdown(SOURCE, config=config, targets=_targets(config))
+    # The caption in the code block is wrongly predicted as the second table.
+    assert texts == {
+        "_table-1": "Table 1",
+        "_table-2": "Table 2",
+        "second": "Table 3",
+        "_list-1": "List 1",
+    }
+
+
+def test_scan_markdown_start_index():
+    config = _config()
+    config.table.start_index = 5
+    config.table.increment_index = 2
+    texts = prescan.scan_markdown(
+        "Table: First\n\n| a |\n|---|\n\nTable: Second\n\n| b |\n|---|\n",
+        config=config,
+        targets=_targets(config),
+    )
+    assert texts == {"_table-5": "Table 5", "_table-7": "Table 7"}
+
+
+def test_scan_wrapped_markdown():
+    config = _config()
+    markdown = wrap_md_captions(SOURCE, targets=_targets(config))
+    texts = prescan.scan_wrapped_markdown(markdown, config=config)
+    assert texts["second"] == "Table 3"
+
+
+def test_guess_title(tmp_path):
+    markdown, page_meta = meta.get_data("---\ntitle: Meta\n---\n# Heading\n")
+    assert prescan.page_title(markdown, page_meta) == "Meta"
+    assert prescan.page_title(SOURCE, {}) == "Page title"
+    assert prescan.page_title("Text\n", {}) is None
+    file = _file(tmp_path, "index.md", "Text\n")
+    assert prescan.guess_title(file, None) == "Home"
+    assert prescan.guess_title(file, "Title") == "Title"
+    file = _file(tmp_path, "my_page.md", "Text\n")
+    assert prescan.guess_title(file, None) == "My page"
+
+
+def test_scan_markdown_invalid_markers():
+    config = _config()
+    markdown = (
+        "```html\n"
+        '<custom-caption class="x">\n'
+        "<table-caption \n"
+        "```\n\n"
+        "Table: First\n\n| a |\n|---|\n"
+    )
+    texts = prescan.scan_markdown(markdown, config=config, targets=_targets(config))
+    assert texts == {"_table-1": "Table 1"}
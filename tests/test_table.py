@@ -411,7 +411,7 @@ def test_postprocess_default_reference(dummy_page):
         post_processor=post_processor,
     )
 
-    assert 'test.html#_table-1"' in post_processor.regex_to_apply
+    assert "_table-1" in post_processor.targets["test.html"]
 
 
 def test_postprocess_ignore_reference_with_text(dummy_page):
@@ -447,7 +447,7 @@ def test_postprocess_custom_reference(dummy_page):
         post_processor=post_processor,
     )
 
-    assert 'test.html#_table-1"' in post_processor.regex_to_apply
+    assert "_table-1" in post_processor.targets["test.html"]
 
 
 def test_colgroups(dummy_page):
@@ -531,8 +531,33 @@ def test_table_caption_with_xml(caplog, dummy_page):
             page=dummy_page,
             post_processor=PostProcessor(),
         )
-    assert "ERROR" in caplog.text
+    assert "ERROR" not in caplog.text
     result = etree.tostring(tree, encoding="unicode", method="html")
-    # HTMLParser adds <html><body> tags, remove them
-    result = result[len("<html><body>") : -len("</body></html>")]
-    assert result == div(DEFAULT_TABLE)
+    assert (
+        '<caption style="caption-side:bottom">&lt;not nice&gt; 1: My Caption</caption>'
+        in result
+    )
+
+
+def test_table_caption_with_html(dummy_page):
+    config = IdentifierCaption()
+    caption = (
+        '<p><table-caption identifier="Table"></p>'
+        "<p>My <strong>bold</strong> caption<br>with a line break</p>"
+        "<p><table-caption-end></p>"
+    )
+    html = div(caption, DEFAULT_TABLE)
+    parser = etree.HTMLParser()
+    tree = etree.fromstring(html, parser)
+    table.postprocess_html(
+        tree=tree,
+        config=config,
+        logger=None,
+        page=dummy_page,
+        post_processor=PostProcessor(),
+    )
+    result = etree.tostring(tree, encoding="unicode", method="html")
+    assert (
+        '<caption style="caption-side:bottom">Table 1: My <strong>bold</strong> '
+        "caption<br>with a line break</caption>"
+    ) in result